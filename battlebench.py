@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+'''
+Checks the unrolled battle kernel against `battle_round` and times both.
+
+`battle_simulate` and `defender_wins_simulate` fight with `battle_round3`,
+`battle_round` is kept as the reference. Every fight is replayed round by
+round with both and the floats compared exactly: all the pairs with up to
+--exhaustive ships of each type, then --samples random ones up to
+--magnitude. Exits with an error on the first difference, then reports the
+rounds and battles per second of each.
+
+    ./battlebench.py --exhaustive 5 --samples 20000
+'''
+
+import argparse
+import itertools
+import random
+import sys
+import time
+from typing import List, Tuple
+
+from shared import (Ships, battle_round, battle_round3, battle_simulate,
+                    defender_wins_simulate, result_defender_wins)
+
+
+def reference_rounds(s1: Ships, s2: Ships) -> List[Tuple[list, list]]:
+    ships1, ships2 = list(s1), list(s2)
+    rounds = [(ships1, ships2)]
+    while sum(ships1) > 0 and sum(ships2) > 0:
+        new1 = battle_round(ships2, ships1)
+        ships2 = battle_round(ships1, ships2)
+        ships1 = new1
+        rounds.append((ships1, ships2))
+    return rounds
+
+
+def kernel_rounds(s1: Ships, s2: Ships) -> List[Tuple[tuple, tuple]]:
+    ships1, ships2 = tuple(s1), tuple(s2)
+    rounds = [(ships1, ships2)]
+    while sum(ships1) > 0 and sum(ships2) > 0:
+        ships1, ships2 = battle_round3(ships1, ships2)
+        rounds.append((ships1, ships2))
+    return rounds
+
+
+def reference_battle(s1: Ships, s2: Ships) -> Tuple[Ships, Ships]:
+    ships1, ships2 = reference_rounds(s1, s2)[-1]
+    return tuple(map(int, ships1)), tuple(map(int, ships2))
+
+
+def check(s1: Ships, s2: Ships) -> bool:
+    expected = reference_rounds(s1, s2)
+    got = kernel_rounds(s1, s2)
+    if len(expected) != len(got):
+        print(f'{s1} vs {s2}: {len(expected)} rounds, got {len(got)}')
+        return False
+
+    for i, ((e1, e2), (g1, g2)) in enumerate(zip(expected, got)):
+        if list(e1) != list(g1) or list(e2) != list(g2):
+            print(f'{s1} vs {s2} round {i}: {e1} {e2}, got {g1} {g2}')
+            return False
+
+    result = reference_battle(s1, s2)
+    if battle_simulate(s1, s2) != result:
+        print(f'{s1} vs {s2}: battle_simulate {battle_simulate(s1, s2)}, '
+              f'expected {result}')
+        return False
+
+    if defender_wins_simulate(s1, s2) != result_defender_wins(*result):
+        print(f'{s1} vs {s2}: defender_wins_simulate differs')
+        return False
+
+    return True
+
+
+def pairs(exhaustive: int, samples: int, magnitude: int, seed: int):
+    counts = range(exhaustive + 1)
+    for ships in itertools.product(counts, repeat=6):
+        yield ships[:3], ships[3:]
+
+    rng = random.Random(seed)
+    for _ in range(samples):
+        yield (tuple(rng.randint(0, magnitude) for _ in range(3)),
+               tuple(rng.randint(0, magnitude) for _ in range(3)))
+
+
+def bench(fights: List[Tuple[Ships, Ships]]):
+    # the states every round of the fights goes through
+    states = [r for s1, s2 in fights for r in reference_rounds(s1, s2)[:-1]]
+
+    start = time.perf_counter()
+    for ships1, ships2 in states:
+        battle_round(ships2, ships1)
+        battle_round(ships1, ships2)
+    reference = time.perf_counter() - start
+
+    states = [(tuple(s1), tuple(s2)) for s1, s2 in states]
+    start = time.perf_counter()
+    for ships1, ships2 in states:
+        battle_round3(ships1, ships2)
+    kernel = time.perf_counter() - start
+
+    print(f'rounds/s   battle_round {len(states) / reference:12.0f}  '
+          f'battle_round3 {len(states) / kernel:12.0f}  '
+          f'x{reference / kernel:.2f}')
+
+    start = time.perf_counter()
+    for s1, s2 in fights:
+        reference_battle(s1, s2)
+    reference = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for s1, s2 in fights:
+        battle_simulate(s1, s2)
+    kernel = time.perf_counter() - start
+
+    print(f'battles/s  battle_round {len(fights) / reference:12.0f}  '
+          f'battle_round3 {len(fights) / kernel:12.0f}  '
+          f'x{reference / kernel:.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--exhaustive', type=int, default=4)
+    parser.add_argument('--samples', type=int, default=20000)
+    parser.add_argument('--magnitude', type=int, default=1000)
+    parser.add_argument('--bench', type=int, default=5000,
+                        help='random fights timed')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    n = 0
+    for s1, s2 in pairs(args.exhaustive, args.samples, args.magnitude,
+                        args.seed):
+        if not check(s1, s2):
+            sys.exit(1)
+        n += 1
+    print(f'{n} fights identical')
+
+    fights = list(pairs(-1, args.bench, args.magnitude, args.seed + 1))
+    bench(fights)
+
+
+if __name__ == '__main__':
+    main()
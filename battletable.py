@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+'''
+Precomputed battle outcomes, shared by all the bots through a memory map.
+
+`battle` only depends on the two ship triples, so every fight with at most
+`--ships` of each type is fought once, offline, and its survivors stored in
+a flat table. The bots map the file read-only, the OS keeps a single copy
+for all of them, and the battle caches look their misses up in it before
+simulating.
+
+    ./battletable.py build battles.tbl --ships 12
+    BATTLE_TABLE=battles.tbl ./bot.py user pass
+
+The table has (ships + 1)^6 entries of 6 bytes, 29MB for 12 ships.
+'''
+
+import argparse
+import mmap
+import random
+import struct
+import time
+from typing import Optional, Tuple
+
+import shared
+from shared import Ships, battle_simulate, result_defender_wins
+
+MAGIC = b'RPSBTL1\0'
+# largest ship count of a type in the table
+HEADER = struct.Struct('<I')
+# survivors of the attacker then of the defender
+ENTRY = struct.Struct('<6B')
+
+MAX_SHIPS = 255
+
+
+class BattleTable():
+    '''
+    read-only view of a built table, `lookup` is None outside of it
+    '''
+
+    def __init__(self, path: str):
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a battle table')
+
+        self.ships, = HEADER.unpack_from(self.mm, len(MAGIC))
+        self.start = len(MAGIC) + HEADER.size
+
+        n = self.ships + 1
+        if len(self.mm) != self.start + n**6 * ENTRY.size:
+            raise ValueError(f'{path} is truncated')
+
+    def index(self, s1: Ships, s2: Ships) -> Optional[int]:
+        n = self.ships + 1
+        i = 0
+        for ships in (s1, s2):
+            for count in ships:
+                count = int(count)
+                if count > self.ships:
+                    return None
+                i = i * n + count
+        return i
+
+    def lookup(self, s1: Ships, s2: Ships) -> Optional[Tuple[Ships, Ships]]:
+        '''
+        `battle(s1, s2)`
+        '''
+        i = self.index(s1, s2)
+        if i is None:
+            return None
+
+        survivors = ENTRY.unpack_from(self.mm, self.start + i * ENTRY.size)
+        return survivors[:3], survivors[3:]
+
+    def defender_wins(self, attacker: Ships, defender: Ships) -> Optional[bool]:
+        result = self.lookup(attacker, defender)
+        if result is None:
+            return None
+        return result_defender_wins(*result)
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+
+def build(path: str, ships: int):
+    '''
+    fights every pair of triples with up to `ships` of each type, a block of
+    the attacker's first type at a time. needs numpy
+    '''
+    np = shared.np
+    if np is None:
+        raise SystemExit('building the table needs numpy')
+    if not 0 <= ships <= MAX_SHIPS:
+        raise SystemExit(f'--ships must be within 0 and {MAX_SHIPS}')
+
+    n = ships + 1
+    # every (attacker[1:], defender) for one attacker[0]
+    rest = np.indices((n, ) * 5).reshape(5, -1).T
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC + HEADER.pack(ships))
+
+        for first in range(n):
+            attackers = np.empty((len(rest), 3), dtype=np.float64)
+            attackers[:, 0] = first
+            attackers[:, 1:] = rest[:, :2]
+            defenders = rest[:, 2:].astype(np.float64)
+
+            survivors = shared.battle_batch_simulate(attackers, defenders)
+            f.write(np.hstack(survivors).astype(np.uint8).tobytes())
+
+            print(f'{first + 1}/{n}', end='\r', flush=True)
+    print()
+
+
+def check(path: str, samples: int, seed: int = 0) -> int:
+    '''
+    compares random entries against `battle_simulate`, returns the mismatches
+    '''
+    table = BattleTable(path)
+    rng = random.Random(seed)
+
+    mismatches = 0
+    for _ in range(samples):
+        s1 = tuple(rng.randint(0, table.ships) for _ in range(3))
+        s2 = tuple(rng.randint(0, table.ships) for _ in range(3))
+        if table.lookup(s1, s2) != battle_simulate(s1, s2):
+            print(f'mismatch {s1} vs {s2}: {table.lookup(s1, s2)} != '
+                  f'{battle_simulate(s1, s2)}')
+            mismatches += 1
+
+    table.close()
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    cmd_build = sub.add_parser('build', help='build a table')
+    cmd_build.add_argument('table')
+    cmd_build.add_argument('--ships', type=int, default=12,
+                           help='largest ship count of a type')
+    cmd_build.add_argument('--check', type=int, default=1000,
+                           help='random entries checked afterwards')
+
+    cmd_check = sub.add_parser('check', help='check a table')
+    cmd_check.add_argument('table')
+    cmd_check.add_argument('--samples', type=int, default=10000)
+
+    args = parser.parse_args()
+
+    if args.cmd == 'build':
+        start = time.perf_counter()
+        build(args.table, args.ships)
+        print(f'built in {time.perf_counter() - start:.1f}s')
+        samples = args.check
+    else:
+        samples = args.samples
+
+    mismatches = check(args.table, samples)
+    print(f'{samples} entries checked, {mismatches} mismatches')
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
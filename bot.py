@@ -6,8 +6,13 @@ import random, pprint
 import sys
 import os
 import time
+import threading
 
 from shared import GameState, Fleet, Planet, Agent, Nop
+from replay import Recorder, FlightRecorder
+from gamelog import GameLogWriter
+from battletable import BattleTable
+import shared
 
 #import view
 #view.init(1024, 768)
@@ -18,8 +23,27 @@ PASSWORD = sys.argv[2]
 URL = 'localhost'
 URL = "rps.vhenne.de"
 
+# eg. RPS_HOST=localhost to play against `engine.py serve`
+URL = os.environ.get('RPS_HOST', URL)
+PORT = int(os.environ.get('RPS_PORT', 6000))
+
+# seconds each tick may take, unlimited if not set
+TICK_BUDGET = os.environ.get('TICK_BUDGET')
+
+# file the states and moves are recorded to for `replay.py`
+RECORD = os.environ.get('RECORD')
+
+# ticks slower than this many ms are dumped to slow_ticks/ for `replay.py`
+SLOW_TICK_MS = os.environ.get('SLOW_TICK_MS')
+
+# binary log of the states, see `gamelog.py`
+GAMELOG = os.environ.get('GAMELOG')
+
+# precomputed battles, see `battletable.py`
+BATTLE_TABLE = os.environ.get('BATTLE_TABLE')
+
 s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-s.connect((URL, 6000))
+s.connect((URL, PORT))
 io = s.makefile('rw')
 
 
@@ -34,7 +58,19 @@ def main():
 
     write('login %s %s' % (USERNAME, PASSWORD))
 
-    agent = Agent()
+    if BATTLE_TABLE:
+        shared.use_battle_table(BattleTable(BATTLE_TABLE))
+
+    agent = Agent(float(TICK_BUDGET) if TICK_BUDGET else None)
+    recorder = Recorder(RECORD) if RECORD else None
+    gamelog = GameLogWriter(GAMELOG) if GAMELOG else None
+    flight = None
+    if SLOW_TICK_MS:
+        flight = FlightRecorder(float(SLOW_TICK_MS) / 1000)
+
+    # warms the agent's caches while waiting for the other player
+    stop = threading.Event()
+    speculation = None
 
     while 1:
         data = io.readline().strip()
@@ -44,19 +80,47 @@ def main():
             continue
 
         elif data[0] == "{":
+            if speculation is not None:
+                stop.set()
+                speculation.join()
+                stop.clear()
+
             state_raw = json.loads(data)
             #        view.update(state)
             # pprint.pprint(state)
 
-            move = agent.tick(state_raw)
+            if flight is not None:
+                move = flight.tick(agent, state_raw)
+            else:
+                move = agent.tick(state_raw)
 
             if not isinstance(move, Nop):
                 print(f'{agent.s.round:03d} {move}')
 
+            if not agent.s.over:
+                write(move.encode())
+
+            # only once answered, a slow tick is late enough already
+            if recorder is not None:
+                recorder.record(state_raw, move)
+            if gamelog is not None:
+                gamelog.write(state_raw)
+            if flight is not None:
+                flight.dump_slow()
+
             if agent.s.over:
+                if gamelog is not None:
+                    gamelog.close()
+                if 'QUIET' not in os.environ:
+                    agent.print_budget()
+                    print(shared.battle_cache)
+                    print(shared.winner_cache)
                 break
 
-            write(move.encode())
+            if 'NO_SPECULATE' not in os.environ:
+                speculation = threading.Thread(
+                    target=agent.speculate, args=(move, stop), daemon=True)
+                speculation.start()
 
         else:
             if data == 'command received. waiting for other player...':
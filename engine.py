@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+'''
+Local headless game server / forward model.
+
+Plays the same game as the remote server, offline. Either in process:
+
+    game = Game.generate(20, seed=1)
+    while not game.over:
+        for p in game.players:
+            game.command(p.id, agent.tick(game.state(p.id)).encode())
+        game.step()
+
+or as a TCP server speaking the protocol `bot.py` expects:
+
+    ./engine.py serve --port 6000
+    RPS_HOST=localhost ./bot.py user pass
+
+The rules are the ones the strats assume: a fleet arrives `distance` rounds
+after being sent, every planet (neutrals too) produces each round, and a
+fleet landing on a planet of another owner fights like in `battle`.
+'''
+
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+from shared import (Agent, Fleet, Planet, Player, battle_simulate,
+                    result_defender_wins, ships_add, ships_sub)
+
+NEUTRAL = 0
+MAX_ROUNDS = 500
+
+MSG_WAITING = 'command received. waiting for other player...'
+MSG_CALCULATING = 'calculating round'
+
+
+class Game():
+    def __init__(self,
+                 planets: List[Planet],
+                 players: List[Player],
+                 max_rounds: int = MAX_ROUNDS):
+        self.planets = planets
+        self.players = players
+        self.fleets: List[Fleet] = []
+        self.round = 0
+        self.winner: Optional[int] = None
+        self.game_over = False
+        self.max_rounds = max_rounds
+
+        self._planet_dict = {p.id: p for p in planets}
+        self._commands: Dict[int, str] = dict()
+        self._next_fleet_id = 0
+
+    @staticmethod
+    def generate(n_planets: int,
+                 seed: Optional[int] = None,
+                 names=('p1', 'p2'),
+                 size: int = 100,
+                 max_rounds: int = MAX_ROUNDS) -> 'Game':
+        '''
+        a random map, point symmetric so both players start even. each
+        player gets one home planet.
+        '''
+        rng = random.Random(seed)
+
+        planets: List[Planet] = []
+        for i in range(0, n_planets, 2):
+            x, y = rng.randrange(size), rng.randrange(size)
+            ships = [rng.randrange(0, 30) for _ in range(3)]
+            production = [rng.randrange(0, 4) for _ in range(3)]
+            planets.append(Planet(i, x, y, NEUTRAL, ships, production))
+            if i + 1 < n_planets:
+                planets.append(
+                    Planet(i + 1, size - x, size - y, NEUTRAL, list(ships),
+                           list(production)))
+
+        players = [Player(i + 1, False, name) for i, name in enumerate(names)]
+        for player, home in zip(players, planets):
+            home.owner_id = player.id
+            home.ships = [100, 100, 100]
+            home.production = [3, 3, 3]
+
+        return Game(planets, players, max_rounds)
+
+    @property
+    def over(self) -> bool:
+        return self.winner is not None or self.game_over
+
+    def state(self, player_id: int) -> dict:
+        '''
+        the raw state as the server sends it to `player_id`
+        '''
+        return {
+            'planets': [{
+                'id': p.id,
+                'x': p.x,
+                'y': p.y,
+                'owner_id': p.owner_id,
+                'ships': list(p.ships),
+                'production': list(p.production),
+            } for p in self.planets],
+            'fleets': [{
+                'id': f.id,
+                'owner_id': f.owner_id,
+                'ships': list(f.ships),
+                'origin': f.origin_id,
+                'target': f.target_id,
+                'eta': f.eta,
+            } for f in self.fleets],
+            'round': self.round,
+            'winner': self.winner,
+            'game_over': self.game_over,
+            'player_id': player_id,
+            'players': [{
+                'id': p.id,
+                'itsme': p.id == player_id,
+                'name': p.name,
+            } for p in self.players],
+        }
+
+    def command(self, player_id: int, command: str):
+        '''
+        registers the `send ...` or `nop` of `player_id` for this round
+        '''
+        self._commands[player_id] = command
+
+    def waiting(self) -> bool:
+        return any(p.id not in self._commands for p in self.players)
+
+    def step(self):
+        '''
+        resolves the round with the commands given so far, missing ones are nops
+        '''
+        if self.over:
+            return
+
+        for player_id, command in self._commands.items():
+            self.launch(player_id, command)
+        self._commands.clear()
+
+        self.round += 1
+
+        for p in self.planets:
+            p.ships = ships_add(p.ships, p.production)
+
+        arrived = [f for f in self.fleets if f.eta <= self.round]
+        self.fleets = [f for f in self.fleets if f.eta > self.round]
+        for f in arrived:
+            self.land(f)
+
+        self.check_over()
+
+    def launch(self, player_id: int, command: str):
+        # invalid commands are ignored, like a nop
+        parts = command.split()
+        if len(parts) != 6 or parts[0] != 'send':
+            return
+
+        try:
+            src_id, target_id, *ships = map(int, parts[1:])
+        except ValueError:
+            return
+
+        src = self._planet_dict.get(src_id)
+        target = self._planet_dict.get(target_id)
+        if src is None or target is None or src is target:
+            return
+
+        if src.owner_id != player_id:
+            return
+
+        if any(n < 0 or n > have for n, have in zip(ships, src.ships)):
+            return
+
+        if sum(ships) == 0:
+            return
+
+        src.ships = ships_sub(src.ships, ships)
+        eta = self.round + src.distance(target)
+        self.fleets.append(
+            Fleet(self._next_fleet_id, player_id, ships, src.id, target.id,
+                  eta))
+        self._next_fleet_id += 1
+
+    def land(self, f: Fleet):
+        target = self._planet_dict[f.target_id]
+        if target.owner_id == f.owner_id:
+            target.ships = ships_add(target.ships, f.ships)
+            return
+
+        # not `battle`, its cache is shared with the other games' threads
+        attacker, defender = battle_simulate(f.ships, target.ships)
+        if result_defender_wins(attacker, defender):
+            target.ships = list(defender)
+        else:
+            target.ships = list(attacker)
+            target.owner_id = f.owner_id
+
+    def check_over(self):
+        alive = set(p.owner_id for p in self.planets)
+        alive.update(f.owner_id for f in self.fleets)
+        alive.discard(NEUTRAL)
+
+        if len(alive) == 1:
+            self.winner = alive.pop()
+            self.game_over = True
+        elif len(alive) == 0:
+            self.game_over = True
+        elif self.round >= self.max_rounds:
+            # most ships wins, draw on a tie
+            self.game_over = True
+            totals = {p.id: self.ships_of(p.id) for p in self.players}
+            best = max(totals.values())
+            leaders = [id for id, n in totals.items() if n == best]
+            if len(leaders) == 1:
+                self.winner = leaders[0]
+
+    def ships_of(self, player_id: int) -> int:
+        total = 0
+        for p in self.planets:
+            if p.owner_id == player_id:
+                total += sum(p.ships)
+        for f in self.fleets:
+            if f.owner_id == player_id:
+                total += sum(f.ships)
+        return total
+
+
+def play(game: Game, agents: Dict[int, Agent]) -> Optional[int]:
+    '''
+    plays `game` to the end in process, the agents keyed by player id.
+    returns the winner
+    '''
+    while not game.over:
+        for player_id, agent in agents.items():
+            move = agent.tick(game.state(player_id))
+            game.command(player_id, move.encode())
+        game.step()
+
+    # the agents see the final state too, that's when they log
+    for player_id, agent in agents.items():
+        agent.tick(game.state(player_id))
+
+    return game.winner
+
+
+def serve_game(game: Game, conns: List[socket.socket]):
+    '''
+    runs one game over the server protocol, a connection per player
+    '''
+    ios = [c.makefile('rw') for c in conns]
+
+    def write(io, data: str):
+        io.write(data + '\n')
+        io.flush()
+
+    try:
+        for player, io in zip(game.players, ios):
+            player.name = io.readline().split()[1]
+
+        while True:
+            for player, io in zip(game.players, ios):
+                write(io, json.dumps(game.state(player.id)))
+
+            if game.over:
+                break
+
+            for player, io in zip(game.players, ios):
+                game.command(player.id, io.readline().strip())
+                write(io, MSG_WAITING)
+
+            for io in ios:
+                write(io, MSG_CALCULATING)
+            game.step()
+
+    except (OSError, IndexError):
+        print('player disconnected')
+
+    finally:
+        for c in conns:
+            c.close()
+
+
+def serve(host: str, port: int, n_planets: int, seed: Optional[int] = None):
+    '''
+    serves games forever, pairing the connections in the order they come
+    '''
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen()
+    print(f'serving on {host}:{port}')
+
+    n_games = 0
+    while True:
+        conns = [server.accept()[0], server.accept()[0]]
+        game_seed = None if seed is None else seed + n_games
+        game = Game.generate(n_planets, game_seed)
+        threading.Thread(target=serve_game, args=(game, conns),
+                         daemon=True).start()
+        n_games += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--planets', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=None)
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    cmd_serve = sub.add_parser('serve', help='serve games over TCP')
+    cmd_serve.add_argument('--host', default='localhost')
+    cmd_serve.add_argument('--port', type=int, default=6000)
+
+    cmd_play = sub.add_parser('play', help='play Agent vs Agent in process')
+    cmd_play.add_argument('--games', type=int, default=1)
+
+    args = parser.parse_args()
+
+    if args.cmd == 'serve':
+        serve(args.host, args.port, args.planets, args.seed)
+
+    elif args.cmd == 'play':
+        for i in range(args.games):
+            seed = None if args.seed is None else args.seed + i
+            game = Game.generate(args.planets, seed)
+            start = time.perf_counter()
+            winner = play(game, {p.id: Agent() for p in game.players})
+            spent = time.perf_counter() - start
+            print(f'game {i}: winner {winner} after {game.round} rounds, '
+                  f'{game.round / spent:.0f} rounds/s')
+
+
+if __name__ == '__main__':
+    main()
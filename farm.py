@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+'''
+Plays many accounts at once from one process, on one asyncio event loop.
+
+Each account is a session with its own connection and `Agent`, logging in
+and playing `--games` games one after the other. The socket I/O of all the
+sessions runs on the loop, the ticks run in an executor so a slow tick in
+one game never holds up reading and answering in the others.
+
+    ./farm.py user1:pass1 user2:pass2
+    ./farm.py --accounts accounts.txt --games 10
+
+The accounts file has a `user password` pair per line. RPS_HOST, RPS_PORT,
+TICK_BUDGET and BATTLE_TABLE are read like in `bot.py`.
+'''
+
+import argparse
+import asyncio
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import shared
+from battletable import BattleTable
+from shared import Agent, Nop
+
+URL = os.environ.get('RPS_HOST', 'rps.vhenne.de')
+PORT = int(os.environ.get('RPS_PORT', 6000))
+
+# seconds each tick may take, unlimited if not set
+TICK_BUDGET = os.environ.get('TICK_BUDGET')
+
+# precomputed battles, see `battletable.py`
+BATTLE_TABLE = os.environ.get('BATTLE_TABLE')
+
+# the server's JSON states are long lines
+LINE_LIMIT = 2**24
+
+MSG_WAITING = 'command received. waiting for other player...'
+MSG_CALCULATING = 'calculating round'
+MSG_FAILED = 'waaait'
+
+
+class Session():
+    '''
+    one account playing its games over its own connection
+    '''
+
+    def __init__(self,
+                 username: str,
+                 password: str,
+                 executor: ThreadPoolExecutor,
+                 host: str = URL,
+                 port: int = PORT,
+                 tick_budget: Optional[float] = None):
+        self.username = username
+        self.password = password
+        self.executor = executor
+        self.host = host
+        self.port = port
+        self.tick_budget = tick_budget
+
+        self.games = 0
+        self.wins = 0
+        # seconds the ticks waited for the executor and ran in it
+        self.queued = 0.0
+        self.ticking = 0.0
+
+    def say(self, msg: str):
+        print(f'[{self.username}] {msg}')
+
+    async def write(self, writer: asyncio.StreamWriter, data: str):
+        writer.write(f'{data}\n'.encode())
+        # waits while the socket's buffer is full
+        await writer.drain()
+
+    async def tick(self, agent: Agent, raw: dict):
+        loop = asyncio.get_running_loop()
+        submitted = time.perf_counter()
+
+        def timed_tick():
+            started = time.perf_counter()
+            move = agent.tick(raw)
+            return started, time.perf_counter(), move
+
+        started, done, move = await loop.run_in_executor(
+            self.executor, timed_tick)
+        self.queued += started - submitted
+        self.ticking += done - started
+        return move
+
+    async def play(self) -> bool:
+        '''
+        logs in and plays one game, False if the server turned us down
+        '''
+        reader, writer = await asyncio.open_connection(
+            self.host, self.port, limit=LINE_LIMIT)
+        agent = Agent(self.tick_budget)
+
+        try:
+            await self.write(writer,
+                             f'login {self.username} {self.password}')
+
+            while True:
+                data = (await reader.readline()).decode().strip()
+                if not data:
+                    self.say('connection closed')
+                    return False
+
+                if data[0] == '{':
+                    move = await self.tick(agent, json.loads(data))
+
+                    if agent.s.over:
+                        self.games += 1
+                        if agent.s.winner == agent.s.player_id:
+                            self.wins += 1
+                        self.say(f'game over after {agent.s.round} rounds, '
+                                 f'winner {agent.s.winner}')
+                        return True
+
+                    if not isinstance(move, Nop):
+                        self.say(f'{agent.s.round:03d} {move}')
+                    await self.write(writer, move.encode())
+
+                elif data in (MSG_WAITING, MSG_CALCULATING):
+                    continue
+
+                elif data == MSG_FAILED:
+                    self.say('failed to register')
+                    return False
+
+                else:
+                    self.say(data)
+
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    async def run(self, games: int):
+        for _ in range(games):
+            try:
+                if not await self.play():
+                    break
+            except OSError as e:
+                self.say(f'disconnected: {e}')
+                break
+            except Exception:
+                # a bad line or a failing tick only ends this session
+                self.say(f'failed:\n{traceback.format_exc()}')
+                break
+
+
+def read_accounts(path: str) -> List[Tuple[str, str]]:
+    accounts = []
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 2:
+                accounts.append((parts[0], parts[1]))
+    return accounts
+
+
+async def farm(accounts: List[Tuple[str, str]],
+               games: int,
+               host: str = URL,
+               port: int = PORT):
+    # the battle caches are shared and not thread safe, so the ticks take
+    # turns on a single thread
+    with ThreadPoolExecutor(1) as executor:
+        tick_budget = float(TICK_BUDGET) if TICK_BUDGET else None
+        sessions = [
+            Session(username, password, executor, host, port, tick_budget)
+            for username, password in accounts
+        ]
+        await asyncio.gather(*(session.run(games) for session in sessions))
+
+    for session in sessions:
+        print(f'{session.username:20s} games {session.games:4d}  '
+              f'wins {session.wins:4d}  '
+              f'ticking {session.ticking:8.1f}s  '
+              f'queued {session.queued:8.1f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('logins', nargs='*', metavar='USER:PASSWORD')
+    parser.add_argument('--accounts', help='file with a `user password` per line')
+    parser.add_argument('--games', type=int, default=1,
+                        help='games each account plays')
+    args = parser.parse_args()
+
+    accounts = [tuple(login.split(':', 1)) for login in args.logins]
+    if args.accounts:
+        accounts += read_accounts(args.accounts)
+    if not accounts:
+        parser.error('no accounts given')
+
+    if BATTLE_TABLE:
+        shared.use_battle_table(BattleTable(BATTLE_TABLE))
+
+    asyncio.run(farm(accounts, args.games))
+
+
+if __name__ == '__main__':
+    main()
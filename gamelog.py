@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+'''
+Compact binary log of game states.
+
+A JSON header with the players, then one fixed width record per round: a
+round header followed by its planets and fleets as little endian int32s.
+Closing the writer appends an index of the round offsets, a log cut short
+without it is scanned instead. The reader memory-maps the file and builds
+the `GameState` of a round straight from the records, no JSON involved.
+
+    GAMELOG=game.rpslog ./bot.py user pass
+    ./gamelog.py game.rpslog
+'''
+
+import argparse
+import json
+import mmap
+import struct
+from typing import Iterator, List, Optional
+
+from shared import Fleet, GameState, Planet, Player
+
+MAGIC = b'RPSLOG1\0'
+INDEX_MAGIC = b'RPSIDX1\0'
+
+# length of the JSON header
+HEADER = struct.Struct('<I')
+# round, winner, game_over, player_id, planets, fleets. -1 for None
+ROUND = struct.Struct('<6i')
+# id, x, y, owner_id, ships * 3, production * 3
+PLANET = struct.Struct('<10i')
+# id, owner_id, ships * 3, origin, target, eta
+FLEET = struct.Struct('<8i')
+# rounds in the index, then INDEX_MAGIC. the offsets come before it
+TRAILER = struct.Struct('<Q8s')
+
+
+def _none(value: Optional[int]) -> int:
+    return -1 if value is None else value
+
+
+def _or_none(value: int) -> Optional[int]:
+    return None if value == -1 else value
+
+
+class GameLogWriter():
+    def __init__(self, path: str):
+        self.file = open(path, 'wb')
+        self.offsets: List[int] = []
+
+    def write(self, raw: dict):
+        '''
+        appends the raw state of a round as the server sent it
+        '''
+        if not self.offsets:
+            self.write_header(raw['players'])
+
+        self.offsets.append(self.file.tell())
+
+        planets, fleets = raw['planets'], raw['fleets']
+        record = [
+            ROUND.pack(raw['round'], _none(raw['winner']),
+                       int(raw['game_over']), _none(raw['player_id']),
+                       len(planets), len(fleets))
+        ]
+        for p in planets:
+            record.append(
+                PLANET.pack(p['id'], p['x'], p['y'], p['owner_id'], *p['ships'],
+                            *p['production']))
+        for f in fleets:
+            record.append(
+                FLEET.pack(f['id'], f['owner_id'], *f['ships'], f['origin'],
+                           f['target'], f['eta']))
+
+        self.file.write(b''.join(record))
+        self.file.flush()
+
+    def write_header(self, players: List[dict]):
+        players = [{'id': p['id'], 'name': p['name']} for p in players]
+        header = json.dumps({'players': players}).encode()
+        self.file.write(MAGIC + HEADER.pack(len(header)) + header)
+
+    def close(self):
+        # nothing written yet, still a log GameLog opens, an empty one
+        if not self.offsets:
+            self.write_header([])
+
+        index = struct.pack(f'<{len(self.offsets)}Q', *self.offsets)
+        self.file.write(index + TRAILER.pack(len(self.offsets), INDEX_MAGIC))
+        self.file.close()
+
+
+class GameLog():
+    '''
+    memory mapped reader, indexed by round number in the log (not `round`)
+    '''
+
+    def __init__(self, path: str):
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a game log')
+
+        start = len(MAGIC)
+        size, = HEADER.unpack_from(self.mm, start)
+        start += HEADER.size
+        header = json.loads(self.mm[start:start + size])
+        self.start = start + size
+        self.players = [(p['id'], p['name']) for p in header['players']]
+
+        self.offsets = self.read_index()
+
+    def read_index(self) -> List[int]:
+        end = len(self.mm)
+        if end - self.start >= TRAILER.size:
+            n, magic = TRAILER.unpack_from(self.mm, end - TRAILER.size)
+            if magic == INDEX_MAGIC:
+                index_start = end - TRAILER.size - 8 * n
+                return list(struct.unpack_from(f'<{n}Q', self.mm, index_start))
+
+        # no index, the writer didn't get to close. walk the records
+        offsets = []
+        offset = self.start
+        while offset + ROUND.size <= end:
+            *_, n_planets, n_fleets = ROUND.unpack_from(self.mm, offset)
+            size = ROUND.size + n_planets * PLANET.size + n_fleets * FLEET.size
+            if offset + size > end:
+                break
+            offsets.append(offset)
+            offset += size
+        return offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, i: int) -> GameState:
+        offset = self.offsets[i]
+        round, winner, game_over, player_id, n_planets, n_fleets = \
+            ROUND.unpack_from(self.mm, offset)
+        offset += ROUND.size
+
+        # unpacked in place, slicing the mmap would copy the records
+        planets = []
+        fleets = []
+        with memoryview(self.mm) as view:
+            size = n_planets * PLANET.size
+            for id, x, y, owner, *ships in PLANET.iter_unpack(
+                    view[offset:offset + size]):
+                planets.append(Planet(id, x, y, owner, ships[:3], ships[3:]))
+            offset += size
+
+            size = n_fleets * FLEET.size
+            for id, owner, s0, s1, s2, origin, target, eta in FLEET.iter_unpack(
+                    view[offset:offset + size]):
+                fleets.append(
+                    Fleet(id, owner, [s0, s1, s2], origin, target, eta))
+
+        player_id = _or_none(player_id)
+        players = [
+            Player(id, id == player_id, name) for id, name in self.players
+        ]
+
+        return GameState(planets, fleets, round, _or_none(winner),
+                         bool(game_over), player_id, players)
+
+    def __iter__(self) -> Iterator[GameState]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def raw(self, i: int) -> dict:
+        '''
+        the round as the raw state the server sent, for `Agent.tick`
+        '''
+        s = self[i]
+        return {
+            'planets': [{
+                'id': p.id,
+                'x': p.x,
+                'y': p.y,
+                'owner_id': p.owner_id,
+                'ships': p.ships,
+                'production': p.production,
+            } for p in s.planets],
+            'fleets': [{
+                'id': f.id,
+                'owner_id': f.owner_id,
+                'ships': f.ships,
+                'origin': f.origin_id,
+                'target': f.target_id,
+                'eta': f.eta,
+            } for f in s.fleets],
+            'round': s.round,
+            'winner': s.winner,
+            'game_over': s.game_over,
+            'player_id': s.player_id,
+            'players': [{
+                'id': p.id,
+                'itsme': p.itsme,
+                'name': p.name,
+            } for p in s.players],
+        }
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+
+def convert(jsonl: str, path: str):
+    '''
+    writes the states of a `replay.py` recording to a game log
+    '''
+    writer = GameLogWriter(path)
+    with open(jsonl) as f:
+        for line in f:
+            if line.strip():
+                writer.write(json.loads(line)['state'])
+    writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('log')
+    parser.add_argument('--from-jsonl', metavar='RECORDING',
+                        help='first convert a replay.py recording into LOG')
+    args = parser.parse_args()
+
+    if args.from_jsonl:
+        convert(args.from_jsonl, args.log)
+
+    log = GameLog(args.log)
+    last = log[len(log) - 1] if len(log) else None
+    print(f'{len(log)} rounds, players {log.players}')
+    if last is not None:
+        print(f'last round {last.round}: {len(last.planets)} planets, '
+              f'{len(last.fleets)} fleets, winner {last.winner}')
+    log.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+'''
+Records games and replays them through a fresh Agent as a benchmark.
+
+`bot.py` records every state it gets and the move it answered when RECORD is
+set, one JSON line per tick:
+
+    RECORD=game.jsonl ./bot.py user pass
+
+Replaying reports the per tick latency percentiles, how it splits between
+the strats and, with --alloc, the memory allocated. It fails if a move
+differs from the recorded one, so optimizations can be shown to not change
+the behaviour.
+
+    ./replay.py game.jsonl
+
+With SLOW_TICK_MS set, `bot.py` also dumps the last few ticks to
+slow_ticks/ whenever one takes longer than that. The dump starts with the
+agent's persistent state, so it replays the same way:
+
+    PROFILE=1 ./replay.py slow_ticks/round_123.jsonl
+'''
+
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import List, Optional, Tuple
+
+import shared
+from gamelog import GameLog
+from shared import Agent, GameStatePer, Move
+
+SLOW_TICKS_DIR = 'slow_ticks'
+SLOW_TICKS_KEPT = 8
+
+
+class Recorder():
+    def __init__(self, path: str):
+        self.file = open(path, 'a')
+
+    def record(self, raw: dict, move: Move):
+        self.file.write(json.dumps({'state': raw, 'move': move.encode()}))
+        self.file.write('\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class FlightRecorder():
+    '''
+    keeps the last `kept` ticks and dumps them when a tick takes longer than
+    `threshold` seconds. each tick keeps the raw state, the move, the
+    `GameStatePer` it started from and its timings.
+
+    `tick` only notes a slow tick, `dump_slow` writes it once the move is
+    answered, so the dump doesn't delay the reply.
+    '''
+
+    def __init__(self,
+                 threshold: float,
+                 directory: str = SLOW_TICKS_DIR,
+                 kept: int = SLOW_TICKS_KEPT):
+        self.threshold = threshold
+        self.directory = directory
+        self.ticks: collections.deque = collections.deque(maxlen=kept)
+        self.slow = False
+
+    def tick(self, agent: Agent, raw: dict) -> Move:
+        per = agent.sp.dump()
+
+        start = time.perf_counter()
+        move = agent.tick(raw)
+        elapsed = time.perf_counter() - start
+
+        self.ticks.append({
+            'state': raw,
+            'move': move.encode(),
+            'per': per,
+            'elapsed': elapsed,
+            'strat_time': dict(agent.tick_time),
+        })
+
+        self.slow = elapsed > self.threshold
+        return move
+
+    def dump_slow(self) -> Optional[str]:
+        '''
+        `dump` if the last tick was slow
+        '''
+        if not self.slow:
+            return None
+        self.slow = False
+        return self.dump()
+
+    def dump(self) -> str:
+        '''
+        writes the kept ticks, the slow one last, in the `load` format
+        '''
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory,
+                            f'round_{self.ticks[-1]["state"]["round"]:03d}.jsonl')
+
+        with open(path, 'w') as f:
+            for i, tick in enumerate(self.ticks):
+                # replaying from the first tick rebuilds all the others
+                if i > 0:
+                    tick = {k: v for k, v in tick.items() if k != 'per'}
+                f.write(json.dumps(tick))
+                f.write('\n')
+
+        print(f'slow tick: {self.ticks[-1]["elapsed"] * 1000:.1f}ms, '
+              f'dumped to {path}')
+        return path
+
+
+def load(path: str) -> List[Tuple[dict, Optional[str], Optional[dict]]]:
+    '''
+    (raw state, move, dumped GameStatePer) of every recorded tick. the
+    GameStatePer is only there in flight recorder dumps, `gamelog.py` logs
+    (*.rpslog) have no moves.
+    '''
+    if path.endswith('.rpslog'):
+        log = GameLog(path)
+        ticks = [(log.raw(i), None, None) for i in range(len(log))]
+        log.close()
+        return ticks
+
+    ticks = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                tick = json.loads(line)
+                ticks.append((tick['state'], tick.get('move'), tick.get('per')))
+    return ticks
+
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def replay(ticks: List[Tuple[dict, Optional[str], Optional[dict]]],
+           agent: Optional[Agent] = None,
+           alloc: bool = False) -> dict:
+    '''
+    runs the recorded states through `agent` (a fresh one by default)
+    '''
+    if agent is None:
+        agent = Agent(log_file=None)
+
+    latencies: List[float] = []
+    allocated: List[int] = []
+    mismatches: List[Tuple[int, str, str]] = []
+
+    for raw, expected, per in ticks:
+        if per is not None:
+            agent.sp = GameStatePer.load(per)
+            agent.s = None
+
+        if alloc:
+            tracemalloc.start()
+
+        start = time.perf_counter()
+        move = agent.tick(raw)
+        latencies.append(time.perf_counter() - start)
+
+        if alloc:
+            allocated.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        if expected is not None and move.encode() != expected:
+            mismatches.append((raw['round'], expected, move.encode()))
+
+    return {
+        'ticks': len(latencies),
+        'latencies': latencies,
+        'allocated': allocated,
+        'strat_time': dict(agent.strat_time),
+        'mismatches': mismatches,
+    }
+
+
+def report(name: str, result: dict):
+    latencies = [t * 1000 for t in result['latencies']]
+    print(f'{name}: {result["ticks"]} ticks, {sum(latencies):.1f}ms')
+    if latencies:
+        print('    latency ms   ' + '  '.join(
+            f'p{p}={percentile(latencies, p):.2f}' for p in (50, 90, 99)) +
+              f'  max={max(latencies):.2f}')
+
+    for strat, spent in result['strat_time'].items():
+        print(f'    {strat:35s} {spent * 1000:10.1f}ms')
+
+    if result['allocated']:
+        allocated = [n / 1024 for n in result['allocated']]
+        print(f'    peak KiB     p50={percentile(allocated, 50):.1f}  '
+              f'max={max(allocated):.1f}')
+
+    for round, expected, got in result['mismatches'][:10]:
+        print(f'    round {round:03d} expected {expected!r} got {got!r}')
+    if result['mismatches']:
+        print(f'    {len(result["mismatches"])} moves differ')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('recordings', nargs='+')
+    parser.add_argument('--alloc', action='store_true',
+                        help='also trace allocations, slows the ticks down')
+    parser.add_argument('--warm', action='store_true',
+                        help='keep the battle caches between recordings')
+    args = parser.parse_args()
+
+    ok = True
+    for path in args.recordings:
+        if not args.warm:
+            shared.battle_cache.clear()
+            shared.winner_cache.clear()
+
+        result = replay(load(path), alloc=args.alloc)
+        report(path, result)
+        ok = ok and not result['mismatches']
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+'''
+Synthetic scaling benchmark for Agent.tick and each strat.
+
+Generates game states with a tunable number of planets and fleets, share of
+owned planets and ship magnitude, sweeps over them and writes one JSON line
+per configuration with the mean seconds of each step. A log-log slope
+against the planet count is added when sweeping it, to catch a change that
+turns an O(n^2) into an O(n^3).
+
+    ./scaling.py --planets 10,30,100,300,1000 --fleets 0,50 > scaling.jsonl
+'''
+
+import argparse
+import itertools
+import json
+import math
+import random
+import time
+from typing import Callable, Dict, List
+
+import shared
+from shared import (Agent, GameState, StratCaptureMultiPlanetState,
+                    strat_capture_simple, strat_defend)
+
+ME, ENEMY, NEUTRAL = 1, 2, 0
+
+
+def synthetic_state(n_planets: int,
+                    n_fleets: int = 0,
+                    mine: float = 0.3,
+                    enemy: float = 0.3,
+                    magnitude: int = 100,
+                    seed: int = 0,
+                    size: int = 0) -> dict:
+    '''
+    a raw state as the server sends it to player 1.
+
+    `mine` and `enemy` are the shares of the planets each player owns, the
+    rest are neutral. ship counts are up to `magnitude` per type. `size` is
+    the side of the map, by default it grows so the planet density stays the same.
+    '''
+    rng = random.Random(seed)
+    size = size or int(10 * math.sqrt(n_planets)) + 10
+
+    planets = []
+    for i in range(n_planets):
+        roll = rng.random()
+        if roll < mine:
+            owner = ME
+        elif roll < mine + enemy:
+            owner = ENEMY
+        else:
+            owner = NEUTRAL
+
+        planets.append({
+            'id': i,
+            'x': rng.randrange(size),
+            'y': rng.randrange(size),
+            'owner_id': owner,
+            'ships': [rng.randrange(magnitude + 1) for _ in range(3)],
+            'production': [rng.randrange(4) for _ in range(3)],
+        })
+
+    # at least one planet each, or there is no game
+    planets[0]['owner_id'] = ME
+    planets[-1]['owner_id'] = ENEMY
+
+    round = 10
+    fleets = []
+    for i in range(n_fleets):
+        owner = rng.choice([ME, ENEMY])
+        origins = [p for p in planets if p['owner_id'] == owner]
+        origin = rng.choice(origins)
+        target = rng.choice(planets)
+        dist = math.ceil(
+            math.hypot(origin['x'] - target['x'], origin['y'] - target['y']))
+        fleets.append({
+            'id': i,
+            'owner_id': owner,
+            'ships': [rng.randrange(magnitude + 1) for _ in range(3)],
+            'origin': origin['id'],
+            'target': target['id'],
+            'eta': round + rng.randint(1, max(1, dist)),
+        })
+
+    return {
+        'planets': planets,
+        'fleets': fleets,
+        'round': round,
+        'winner': None,
+        'game_over': False,
+        'player_id': ME,
+        'players': [
+            {'id': ME, 'itsme': True, 'name': 'me'},
+            {'id': ENEMY, 'itsme': False, 'name': 'enemy'},
+        ],
+    }
+
+
+def timed(f: Callable, *args) -> float:
+    start = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - start
+
+
+def measure(raw: dict) -> Dict[str, float]:
+    '''
+    seconds of the once per game init, a whole tick and each strat on its own
+    (the tick skips the strats that can't beat the best move)
+    '''
+    shared.battle_cache.clear()
+    shared.winner_cache.clear()
+
+    agent = Agent(log_file=None)
+    s = GameState.load(raw)
+    times = {'init': timed(agent.sp.init, s)}
+
+    # strats on their own, cold caches each
+    sp = agent.sp
+    scmps: StratCaptureMultiPlanetState = sp.strat_states[
+        StratCaptureMultiPlanetState.__name__]
+    for name, strat in [('strat_defend', strat_defend),
+                        ('strat_capture_simple', strat_capture_simple),
+                        ('multi_capture_search', scmps.search)]:
+        shared.battle_cache.clear()
+        shared.winner_cache.clear()
+        times[name] = timed(strat, sp, GameState.load(raw))
+
+    # a fresh agent, the search above filled this one's candidate cache
+    shared.battle_cache.clear()
+    shared.winner_cache.clear()
+    agent = Agent(log_file=None)
+    agent.sp.init(s)
+    agent.s = s
+    times['tick'] = timed(agent.tick, raw)
+
+    return times
+
+
+def slopes(rows: List[dict], keys: List[str]) -> Dict[str, float]:
+    '''
+    log-log slope of each timing against the planet count, ~ the exponent
+    '''
+    rows = sorted(rows, key=lambda r: r['planets'])
+    first, last = rows[0], rows[-1]
+    result = dict()
+    for key in keys:
+        if first[key] > 0 and last[key] > 0:
+            result[key] = (math.log(last[key] / first[key]) /
+                           math.log(last['planets'] / first['planets']))
+    return result
+
+
+def ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(',')]
+
+
+def floats(value: str) -> List[float]:
+    return [float(v) for v in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--planets', type=ints, default=[10, 30, 100, 300])
+    parser.add_argument('--fleets', type=ints, default=[0, 50])
+    parser.add_argument('--mine', type=floats, default=[0.3])
+    parser.add_argument('--enemy', type=floats, default=[0.3])
+    parser.add_argument('--magnitude', type=ints, default=[100])
+    parser.add_argument('--samples', type=int, default=3,
+                        help='states generated per configuration')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    keys = [
+        'init', 'tick', 'strat_defend', 'strat_capture_simple',
+        'multi_capture_search'
+    ]
+
+    sweeps: Dict[tuple, List[dict]] = dict()
+    for n_fleets, mine, enemy, magnitude, n_planets in itertools.product(
+            args.fleets, args.mine, args.enemy, args.magnitude, args.planets):
+
+        samples = []
+        for i in range(args.samples):
+            raw = synthetic_state(n_planets, n_fleets, mine, enemy, magnitude,
+                                  args.seed + i)
+            samples.append(measure(raw))
+
+        row = {
+            'planets': n_planets,
+            'fleets': n_fleets,
+            'mine': mine,
+            'enemy': enemy,
+            'magnitude': magnitude,
+        }
+        for key in keys:
+            row[key] = sum(t[key] for t in samples) / len(samples)
+
+        print(json.dumps(row), flush=True)
+        sweeps.setdefault((n_fleets, mine, enemy, magnitude), []).append(row)
+
+    if len(args.planets) > 1:
+        for (n_fleets, mine, enemy, magnitude), rows in sweeps.items():
+            print(json.dumps({
+                'fleets': n_fleets,
+                'mine': mine,
+                'enemy': enemy,
+                'magnitude': magnitude,
+                'slopes': slopes(rows, keys),
+            }))
+
+
+if __name__ == '__main__':
+    main()
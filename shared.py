@@ -1,13 +1,27 @@
 #!/usr/bin/env python3
 import os.path
+import bisect
 
-from dataclasses import dataclass, field, fields, asdict
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields, asdict, replace
 from math import ceil, sqrt
 from typing import List, Tuple, Optional, Iterable, Union, Dict, Any, Callable, Set
 from typing import List, Tuple, Optional, Iterable, Union
 import time
+import threading
 import pprint
 import csv
+import cProfile
+import functools
+import heapq
+import io
+import itertools
+import pstats
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 @dataclass
@@ -23,9 +37,8 @@ class Stats():
     Opponent: str = None
 
 
-stats = Stats()
-
 CSV_FILE = "istsatlog.csv"
+PROFILE_NAME = "istsatprof.txt"
 
 Move = Union['Nop', 'Send']
 Ships = Tuple[int, int, int]
@@ -36,6 +49,19 @@ PRIO_CAPTURE_MULTI_2ND = 4
 PRIO_DEFENCE = 3
 PRIO_BAILOUT = 1
 
+# only bail out of planets attacked within this many rounds
+BAILOUT_MAX_DELAY = 4
+
+BATTLE_CACHE_SIZE = 2**16
+
+# sources tried per target by the multi planet capture, None for no limit
+MULTI_CAPTURE_TOP_K = 8
+MULTI_CAPTURE_MAX_DIST = None
+MULTI_CAPTURE_BATCH = 64
+
+# captures send only the fewest ships that win, not the whole stack
+CAPTURE_FEWEST_SHIPS = True
+
 
 def ships_add(a: Ships, b: Ships) -> Ships:
     return [x + y for x, y in zip(a, b)]
@@ -53,6 +79,11 @@ def ships_lt(a: Ships, b: Ships) -> Ships:
     return sum(a) < sum(b)
 
 
+def ships_le(a: Ships, b: Ships) -> bool:
+    # no type of `a` has more than in `b`
+    return a[0] <= b[0] and a[1] <= b[1] and a[2] <= b[2]
+
+
 @dataclass
 class Planet():
     id: int
@@ -154,10 +185,47 @@ class GameState():
 
     _planet_dict: Dict[int, Planet] = field(init=False)
     _fleet_dict: Dict[int, Planet] = field(init=False)
+    _fleets_by_target: Dict[int, List[Fleet]] = field(init=False)
+    _fleets_by_origin: Dict[int, List[Fleet]] = field(init=False)
+    _fleets_by_owner: Dict[int, List[Fleet]] = field(init=False)
+    _attacks: Optional[Tuple[Set[Planet], List[Fleet]]] = field(init=False)
+    _arrays: Optional['GameArrays'] = field(init=False)
+    _spare_ships: Dict[int, Optional[Ships]] = field(init=False)
+    _thresholds: Dict[Tuple[int, int], 'AttackThreshold'] = field(init=False)
+    _timelines: Dict[Tuple[int, Optional[int]],
+                     'PlanetTimeline'] = field(init=False)
 
     def __post_init__(self):
         self._planet_dict = {p.id: p for p in self.planets}
         self._fleet_dict = {f.id: f for f in self.fleets}
+        self._timelines = dict()
+        self.index_fleets()
+
+    def index_fleets(self):
+        '''
+        (re)builds the per target, origin and owner fleet lists, sorted by eta
+        '''
+        self._fleets_by_target = dict()
+        self._fleets_by_origin = dict()
+        self._fleets_by_owner = dict()
+        self._attacks = None
+        self._arrays = None
+        self._spare_ships = dict()
+        self._thresholds = dict()
+
+        for f in sorted(self.fleets, key=lambda f: f.eta):
+            self._fleets_by_target.setdefault(f.target_id, []).append(f)
+            self._fleets_by_origin.setdefault(f.origin_id, []).append(f)
+            self._fleets_by_owner.setdefault(f.owner_id, []).append(f)
+
+    @property
+    def arrays(self) -> 'GameArrays':
+        '''
+        the state as numpy arrays, built on first use each tick. needs numpy
+        '''
+        if self._arrays is None:
+            self._arrays = GameArrays(self)
+        return self._arrays
 
     def planet_get(self, id: int) -> Planet:
         return self._planet_dict[id]
@@ -165,10 +233,125 @@ class GameState():
     def fleet_get(self, id: int) -> Fleet:
         return self._fleet_dict[id]
 
+    def fleets_to(self, planet_id: int) -> List[Fleet]:
+        return self._fleets_by_target.get(planet_id, [])
+
+    def fleets_from(self, planet_id: int) -> List[Fleet]:
+        return self._fleets_by_origin.get(planet_id, [])
+
+    def fleets_of(self, owner_id: int) -> List[Fleet]:
+        return self._fleets_by_owner.get(owner_id, [])
+
+    def timeline(self, p: Planet,
+                 without: Optional[int] = None) -> 'PlanetTimeline':
+        '''
+        the `PlanetTimeline` of `p`, leaving out the fleets of player
+        `without`. built on first use and kept across `update`s for as long
+        as the planet and its fleets go as it projected.
+        '''
+        key = p.id, without
+        t = self._timelines.get(key)
+        if t is None:
+            t = PlanetTimeline(p, self._timeline_fleets(p.id, without),
+                               self.round)
+            self._timelines[key] = t
+        return t
+
+    def _timeline_fleets(self, planet_id: int,
+                         without: Optional[int]) -> List[Fleet]:
+        return [f for f in self.fleets_to(planet_id) if f.owner_id != without]
+
     @property
     def over(self) -> bool:
         return self.winner is not None or self.game_over
 
+    def update(self, raw: dict):
+        '''
+        patches the state in place to the next round's `raw` state
+
+        planets and players are fixed for the whole game, so the same objects
+        are kept and only their owner and ships change. fleets are matched by
+        id, only the new ones are loaded.
+        '''
+        for raw_planet in raw['planets']:
+            p = self._planet_dict.get(raw_planet['id'])
+            if p is None:
+                p = Planet.load(raw_planet)
+                self.planets.append(p)
+                self._planet_dict[p.id] = p
+                continue
+
+            p.owner_id = raw_planet['owner_id']
+            p.ships = raw_planet['ships']
+
+        fleets = []
+        for raw_fleet in raw['fleets']:
+            f = self._fleet_dict.get(raw_fleet['id'])
+            if f is None:
+                f = Fleet.load(raw_fleet)
+            fleets.append(f)
+
+        self.fleets = fleets
+        self._fleet_dict = {f.id: f for f in fleets}
+        self.round = raw['round']
+        self.winner = raw['winner']
+        self.game_over = raw['game_over']
+        self.player_id = raw['player_id']
+
+        self.index_fleets()
+
+        # only the timelines of planets something unforeseen happened to
+        # are built again
+        timelines = self._timelines
+        self._timelines = dict()
+        for (id, without), t in timelines.items():
+            fleets = self._timeline_fleets(id, without)
+            if t.holds(self.planet_get(id), fleets, self.round):
+                self._timelines[id, without] = t
+
+    def adopt_timelines(self, projection: 'GameState'):
+        '''
+        takes over the timelines of a `project`ion of this round that still
+        hold, as `update` keeps its own
+        '''
+        for (id, without), t in projection._timelines.items():
+            if (id, without) in self._timelines:
+                continue
+            fleets = self._timeline_fleets(id, without)
+            if t.holds(self.planet_get(id), fleets, self.round):
+                self._timelines[id, without] = t
+
+    def project(self, move: Optional['Send'] = None) -> 'GameState':
+        '''
+        best guess of the next round: `move` is launched, every planet
+        produces and the fleets due land. the enemy moves are unknown.
+        '''
+        planets = [replace(p, ships=p.ships_in(1)) for p in self.planets]
+        s = GameState(planets, [], self.round + 1, None, False, self.player_id,
+                      self.players)
+
+        fleets = list(self.fleets)
+        if isinstance(move, Send):
+            src = s.planet_get(move.src.id)
+            src.ships = ships_sub(src.ships, move.ships)
+            eta = self.round + move.src.distance(move.target)
+            fleets.append(
+                Fleet(-1, src.owner_id, move.ships, src.id, move.target.id,
+                      eta))
+
+        for f in sorted(fleets, key=lambda f: f.eta):
+            if f.eta > s.round:
+                s.fleets.append(f)
+                continue
+
+            target = s.planet_get(f.target_id)
+            target.owner_id, ships = land(target.owner_id, target.ships, f)
+            target.ships = list(ships)
+
+        s._fleet_dict = {f.id: f for f in s.fleets}
+        s.index_fleets()
+        return s
+
     @staticmethod
     def load(raw: dict) -> 'GameState':
 
@@ -183,13 +366,283 @@ class GameState():
         )
 
 
+def land(owner_id: int, ships: Ships, f: Fleet) -> Tuple[int, Ships]:
+    '''
+    the owner and ships of a planet after `f` lands on it
+    '''
+    if owner_id == f.owner_id:
+        return owner_id, ships_add(ships, f.ships)
+
+    attacker, defender = battle(f.ships, ships)
+    if result_defender_wins(attacker, defender):
+        return owner_id, defender
+    return f.owner_id, attacker
+
+
+class PlanetTimeline():
+    '''
+    the future of a planet if no more fleets are sent: its owner and ships
+    after each round fleets land on it, fought in the order they land. in
+    between it only produces, so that's all there is to keep and any round
+    can be asked for.
+    '''
+
+    def __init__(self, planet: Planet, fleets: List[Fleet], round: int):
+        '''
+        `fleets` are the ones heading to `planet`, by eta
+        '''
+        self.production = planet.production
+        # (id, eta) of the fleets, to tell if it still holds next round
+        self.fleets = [(f.id, f.eta) for f in fleets]
+
+        owner, ships = planet.owner_id, tuple(planet.ships)
+        self.rounds = [round]
+        self.owners = [owner]
+        self.ships = [ships]
+        # (round, attacker, ships before, ships after) of every fight
+        self.fights: List[Tuple[int, Ships, Ships, Ships]] = []
+        # `defends` of each fight, kept for as long as the timeline is
+        self._defends: Dict[int, 'MonotoneCache'] = dict()
+
+        for eta, landing in itertools.groupby(fleets, key=lambda f: f.eta):
+            eta = max(eta, round)
+            ships = self.produced(ships, eta - self.rounds[-1])
+            for f in landing:
+                before = tuple(ships)
+                fight = f.owner_id != owner
+                owner, ships = land(owner, ships, f)
+                if fight:
+                    self.fights.append((eta, f.ships, before, tuple(ships)))
+
+            self.rounds.append(eta)
+            self.owners.append(owner)
+            self.ships.append(tuple(ships))
+
+    def produced(self, ships: Ships, ticks: int) -> Ships:
+        return tuple(n + ticks * p for n, p in zip(ships, self.production))
+
+    def at(self, round: int) -> Tuple[int, Ships]:
+        '''
+        owner and ships at the end of `round`, the fleets due landed
+        '''
+        i = max(0, bisect.bisect_right(self.rounds, round) - 1)
+        return self.owners[i], self.produced(self.ships[i],
+                                             round - self.rounds[i])
+
+    def owner_at(self, round: int) -> int:
+        return self.at(round)[0]
+
+    def held(self, owner_id: int, round: int = -1) -> bool:
+        '''
+        True if `owner_id` never looses the planet after `round`
+        '''
+        i = max(0, bisect.bisect_right(self.rounds, round) - 1)
+        return all(owner == owner_id for owner in self.owners[i:])
+
+    def next_fight(self, round: int) -> int:
+        '''
+        index of the first fight after `round`, len(fights) if none
+        '''
+        return bisect.bisect_right([f[0] for f in self.fights], round)
+
+    def defends(self, i: int, ships: Ships) -> bool:
+        '''
+        True if the defender wins fight `i` and all the later ones with
+        `ships` instead of the projected ones when the fight starts. what
+        lands and is produced in between is the same as projected.
+        '''
+        if i not in self._defends:
+            self._defends[i] = MonotoneCache(
+                lambda ships: self.fight_from(i, ships))
+        return self._defends[i].wins(ships)
+
+    def fight_from(self, i: int, ships: Ships) -> bool:
+        after = self.fights[i][2]
+        for eta, attacker, before, projected in self.fights[i:-1]:
+            # the ships missing at the last fight are still missing
+            ships = ships_add(ships, ships_sub(before, after))
+            attacker, ships = battle(attacker, ships)
+            if not result_defender_wins(attacker, ships):
+                return False
+            after = projected
+
+        eta, attacker, before, projected = self.fights[-1]
+        return defender_wins(attacker, ships_add(ships,
+                                                 ships_sub(before, after)))
+
+    def holds(self, planet: Planet, fleets: List[Fleet], round: int) -> bool:
+        '''
+        True if `planet`, with `fleets` heading to it, is as projected for
+        `round`, so the rest of the projection is still right
+        '''
+        if [f.id for f in fleets] != [id for id, eta in self.fleets
+                                      if eta > round]:
+            return False
+        return self.at(round) == (planet.owner_id, tuple(planet.ships))
+
+
+def holds_out(s: GameState, p: Planet, garrison: Ships) -> bool:
+    '''
+    True if `p` still holds with only `garrison` of its ships left, given it
+    does with all of them. only the fights of `s.timeline(p)` are fought
+    again, and those once for the timeline's whole life
+    '''
+    timeline = s.timeline(p)
+    i = timeline.next_fight(s.round)
+    if i == len(timeline.fights):
+        return True
+
+    before = timeline.fights[i][2]
+    return timeline.defends(i, ships_sub(before, ships_sub(p.ships, garrison)))
+
+
+def planet_timeline(s: GameState,
+                    p: Planet,
+                    ships: Optional[Ships] = None,
+                    extra: Iterable[Fleet] = ()) -> PlanetTimeline:
+    '''
+    what-if `PlanetTimeline` of `p` with `ships` instead of its own and the
+    `extra` fleets sent too. not kept, unlike `GameState.timeline`
+    '''
+    if ships is not None:
+        p = replace(p, ships=ships)
+    fleets = sorted(itertools.chain(s.fleets_to(p.id), extra),
+                    key=lambda f: f.eta)
+    return PlanetTimeline(p, fleets, s.round)
+
+
+class GameArrays():
+    '''
+    struct of arrays view of a GameState, for bulk queries as array ops.
+
+    row i of the planet arrays is `planets[i]`, the same objects as the
+    GameState's, so masks map back to them with `select`. fleets refer to
+    planets by row. the objects stay what the strats change, the arrays are
+    built from them on first use each tick.
+    '''
+
+    def __init__(self, s: GameState):
+        self.player_id = s.player_id
+        self.round = s.round
+        self.planets = s.planets
+
+        n = len(s.planets)
+        self.ids = np.array([p.id for p in s.planets], dtype=np.int64)
+        self.x = np.array([p.x for p in s.planets], dtype=np.int64)
+        self.y = np.array([p.y for p in s.planets], dtype=np.int64)
+        self.owner = np.array([p.owner_id for p in s.planets], dtype=np.int64)
+        self.ships = np.array([p.ships for p in s.planets],
+                              dtype=np.int64).reshape(n, 3)
+        self.production = np.array([p.production for p in s.planets],
+                                   dtype=np.int64).reshape(n, 3)
+        self.row = {id: i for i, id in enumerate(self.ids.tolist())}
+
+        m = len(s.fleets)
+        self.fleet_owner = np.array([f.owner_id for f in s.fleets],
+                                    dtype=np.int64)
+        self.fleet_ships = np.array([f.ships for f in s.fleets],
+                                    dtype=np.int64).reshape(m, 3)
+        self.fleet_target = np.array([self.row[f.target_id] for f in s.fleets],
+                                     dtype=np.int64)
+        self.fleet_eta = np.array([f.eta for f in s.fleets], dtype=np.int64)
+
+    def friendly(self):
+        return self.owner == self.player_id
+
+    def unfriendly(self):
+        return self.owner != self.player_id
+
+    def neutrals(self):
+        return self.owner == 0
+
+    def enemies(self):
+        return self.unfriendly() & ~self.neutrals()
+
+    def select(self, mask) -> List[Planet]:
+        return [self.planets[i] for i in np.flatnonzero(mask).tolist()]
+
+    def ships_in(self, ticks, rows=None):
+        '''
+        `Planet.ships_in` of every planet, or of the `rows`. `ticks` is a
+        number or one per planet
+        '''
+        ships, production = self.ships, self.production
+        if rows is not None:
+            ships, production = ships[rows], production[rows]
+        return ships + production * np.reshape(ticks, (-1, 1))
+
+    def fleets_from(self, friendly: Optional[bool] = None):
+        # the fleets of us, of the others or everybody's
+        if friendly is None:
+            return np.ones(len(self.fleet_owner), dtype=bool)
+        return (self.fleet_owner == self.player_id) == friendly
+
+    def incoming(self, friendly: Optional[bool] = None):
+        '''
+        sum of the ships of the fleets heading to each planet, only the
+        friendly or unfriendly ones if `friendly` is given
+        '''
+        fleets = self.fleets_from(friendly)
+        ships = np.zeros_like(self.ships)
+        np.add.at(ships, self.fleet_target[fleets], self.fleet_ships[fleets])
+        return ships
+
+    def targeted(self, friendly: Optional[bool] = None):
+        '''
+        mask of the planets a fleet heads to, only the friendly or unfriendly
+        ones if `friendly` is given
+        '''
+        mask = np.zeros(len(self.planets), dtype=bool)
+        mask[self.fleet_target[self.fleets_from(friendly)]] = True
+        return mask
+
+    def distances(self):
+        '''
+        N x N `Planet.distance` between every two planets
+        '''
+        dx = self.x[:, None] - self.x[None, :]
+        dy = self.y[:, None] - self.y[None, :]
+        return np.ceil(np.sqrt(dx * dx + dy * dy)).astype(np.int64)
+
+
+class Deadline():
+    '''
+    time budget of a tick, in seconds. None means no limit.
+
+    strats check `expired` inside their candidate loops and return the best
+    move found so far once it is.
+    '''
+
+    def __init__(self,
+                 budget: Optional[float] = None,
+                 stop: Optional[threading.Event] = None):
+        '''
+        also expires as soon as `stop` is set
+        '''
+        self.start = time.perf_counter()
+        self.end = None if budget is None else self.start + budget
+        self.stop = stop
+
+    def expired(self) -> bool:
+        if self.stop is not None and self.stop.is_set():
+            return True
+        return self.end is not None and time.perf_counter() >= self.end
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+
 @dataclass
 class GameStatePer():
     inited: bool = False
     strat_states: Dict[str, Any] = field(init=False)
     reserved_planets: Set[Planet] = field(default_factory=set)
+    deadline: Deadline = field(default_factory=Deadline)
+    stats: Stats = field(default_factory=Stats)
 
-    _dists_tbl: dict = field(default_factory=dict)
+    _dists_tbl: List[List[int]] = field(default_factory=list)
+    _dists_idx: Dict[int, int] = field(default_factory=dict)
+    _neighbours: Dict[int, List[int]] = field(default_factory=dict)
 
     def __post_init__(self):
         self.strat_states = dict()
@@ -197,20 +650,68 @@ class GameStatePer():
         cls = StratCaptureMultiPlanetState
         self.strat_states[cls.__name__] = cls(0, 0, 0, 0)
 
+    def dump(self) -> dict:
+        '''
+        the state that carries over between ticks, see `load`. the distances
+        are left out, `init` works them out again.
+        '''
+        return {
+            'reserved_planets': sorted(self.reserved_planets),
+            'strat_states': {
+                name: asdict(state)
+                for name, state in self.strat_states.items()
+            },
+            'stats': asdict(self.stats),
+        }
+
+    @staticmethod
+    def load(raw: dict) -> 'GameStatePer':
+        sp = GameStatePer()
+        sp.reserved_planets = set(raw['reserved_planets'])
+        for name, state in raw['strat_states'].items():
+            cls = type(sp.strat_states[name])
+            sp.strat_states[name] = cls(**state)
+        sp.stats = Stats(**raw['stats'])
+        return sp
+
     def init(self, s: GameState):
         if self.inited:
             return
 
         self.calculate_dists(s)
+        self.inited = True
 
     def calculate_dists(self, s: GameState):
-        for a in s.planets:
-            self._dists_tbl[a] = dict()
-            for b in s.planets:
-                self._dists_tbl[a][b] = a.distance(b)
+        # planets never move, so this is done once per game
+        self._dists_idx = {p.id: i for i, p in enumerate(s.planets)}
+
+        if np is not None:
+            dists = s.arrays.distances()
+            self._dists_tbl = dists.tolist()
+
+            ids = s.arrays.ids
+            nearest = np.argsort(dists, axis=1, kind='stable')
+            for i, a in enumerate(s.planets):
+                others = nearest[i][nearest[i] != i]
+                self._neighbours[a.id] = ids[others].tolist()
+            return
+
+        self._dists_tbl = [[a.distance(b) for b in s.planets]
+                           for a in s.planets]
+
+        for a, row in zip(s.planets, self._dists_tbl):
+            others = [b for b in s.planets if b.id != a.id]
+            others.sort(key=lambda b: row[self._dists_idx[b.id]])
+            self._neighbours[a.id] = [b.id for b in others]
 
-    def dist(self, a: int, b: int) -> int:
-        return self._dists_tbl[a][b]
+    def dist(self, a: Planet, b: Planet) -> int:
+        return self._dists_tbl[self._dists_idx[a.id]][self._dists_idx[b.id]]
+
+    def neighbours(self, p: Planet) -> List[int]:
+        '''
+        ids of all the other planets, nearest to `p` first
+        '''
+        return self._neighbours[p.id]
 
     def reserve(self, p: Planet):
         if isinstance(p, Planet):
@@ -268,135 +769,280 @@ class Nop():
         return 'nop'
 
 
-def friendly(s: GameState) -> Iterable[Planet]:
-    for p in s.planets:
-        if p.owner_id == s.player_id:
-            yield p
+# the planet selectors are masks over `GameState.arrays` when numpy is there
 
 
-def unfriendly(s: GameState) -> Iterable[Planet]:
-    for p in s.planets:
-        if p.owner_id != s.player_id:
-            yield p
+def friendly(s: GameState) -> List[Planet]:
+    if np is not None:
+        return s.arrays.select(s.arrays.friendly())
+    return [p for p in s.planets if p.owner_id == s.player_id]
 
 
-def neutrals(s: GameState) -> Iterable[Planet]:
-    for p in s.planets:
-        if p.owner_id == 0:
-            yield p
+def unfriendly(s: GameState) -> List[Planet]:
+    if np is not None:
+        return s.arrays.select(s.arrays.unfriendly())
+    return [p for p in s.planets if p.owner_id != s.player_id]
+
+
+def neutrals(s: GameState) -> List[Planet]:
+    if np is not None:
+        return s.arrays.select(s.arrays.neutrals())
+    return [p for p in s.planets if p.owner_id == 0]
+
+
+def untargeted(s: GameState, friendly: Optional[bool] = None) -> List[Planet]:
+    '''
+    the unfriendly planets no fleet heads to, only counting the friendly or
+    unfriendly fleets if `friendly` is given
+    '''
+    if np is not None:
+        a = s.arrays
+        return a.select(a.unfriendly() & ~a.targeted(friendly))
+
+    return [
+        p for p in s.planets if p.owner_id != s.player_id and not any(
+            friendly is None or (f.owner_id == s.player_id) == friendly
+            for f in s.fleets_to(p.id))
+    ]
+
+
+def ships_in(s: GameState, planets: List[Planet],
+             ticks: List[int]) -> List[Ships]:
+    '''
+    `Planet.ships_in` of each of `planets`, in as many `ticks` each
+    '''
+    if np is not None and planets:
+        a = s.arrays
+        rows = [a.row[p.id] for p in planets]
+        return a.ships_in(ticks, rows).tolist()
+    return [p.ships_in(t) for p, t in zip(planets, ticks)]
+
+
+def nearest_friendly(sp: GameStatePer, s: GameState, p: Planet,
+                     exclude: Set[Planet] = frozenset()) -> List[Planet]:
+    '''
+    friendly planets other than `p` and not in `exclude`, nearest to `p` first
+    '''
+    planets = []
+    for id in sp.neighbours(p):
+        other = s.planet_get(id)
+        if other.owner_id == s.player_id and other not in exclude:
+            planets.append(other)
+    return planets
 
 
 def incoming_fleets(s: GameState, planet: Planet) -> Iterable[Fleet]:
-    for f in s.fleets:
-        if f.target_id == planet.id:
-            yield f
+    return s.fleets_to(planet.id)
 
 
 def incoming_friendly_fleet(s: GameState, target: Planet):
     inc = incoming_fleets(s, target)
-    fleets = list(filter(lambda f: f.owner_id == s.player_id, inc))
-    fleets.sort(key=lambda f: f.eta)
-    return fleets
+    return [f for f in inc if f.owner_id == s.player_id]
 
 
 def has_incoming_friendly_fleet(s: GameState, target: Planet):
-    inc = list(incoming_friendly_fleet(s, target))
-    return len(inc) > 0
+    inc = incoming_fleets(s, target)
+    return any(f.owner_id == s.player_id for f in inc)
 
 
 def has_incoming_enemy_fleet(s: GameState, target: Planet):
     inc = incoming_fleets(s, target)
-    inc = list(filter(lambda f: f.owner_id != s.player_id, inc))
-    return len(inc) > 0
+    return any(f.owner_id != s.player_id for f in inc)
 
 
 def attacks(sp: GameStatePer, s: GameState) -> Tuple[Set[Planet], List[Fleet]]:
+    # the same every call of a tick, so only worked out once
+    if s._attacks is not None:
+        return s._attacks
+
     attacked_planets: Set[Planet] = set()
     attacking_fleets: List[Fleet] = list()
 
-    for fleet in s.fleets:
-        is_friendly = fleet.owner_id == s.player_id
+    for player in s.players:
+        is_friendly = player.id == s.player_id
         if is_friendly:
             continue
 
-        target = s.planet_get(fleet.target_id)
-        if target.owner_id != s.player_id:
-            continue
+        for fleet in s.fleets_of(player.id):
+            target = s.planet_get(fleet.target_id)
+            if target.owner_id != s.player_id:
+                continue
 
-        attacked_planets.add(target)
-        attacking_fleets.append(fleet)
+            attacked_planets.add(target)
+            attacking_fleets.append(fleet)
 
     attacking_fleets.sort(key=lambda f: f.eta)
 
-    return attacked_planets, attacking_fleets
+    s._attacks = attacked_planets, attacking_fleets
+    return s._attacks
 
 
-def available_ships(sp: GameStatePer, s: GameState, p: Planet) -> Ships:
-    # under attack and will win
-    ships = (0, 0, 0)
-    delay = 500
-    for f in s.fleets:
-        if f.target_id == p.id:
-            delay2 = f.eta - s.round
-            if delay2 < delay:
-                delay = delay2
-            ships = ships_add(ships, f.ships)
-    attack_ships = ships
-
-    # WILL LOOSE
-    result = battle(ships, ships_add(p.ships, p.ships_in(delay)))
-    if not result_defender_wins(*result):
+def fewest(ships: Ships,
+           wins: Callable[[Ships], bool],
+           deadline: Optional[Deadline] = None) -> Optional[Ships]:
+    '''
+    the fewest of `ships` that still `wins`, None if not even all of them do.
+
+    `wins` must hold for any more ships than a winning stack, so each type in
+    turn is binary searched down to the least that still wins with the others
+    fixed, about 3 * log2(ships) probes. once `deadline` expired it returns
+    the least stack found so far, that still wins.
+    '''
+    wins_ = MonotoneCache(wins).wins
+
+    if not wins_(ships):
         return None
+    if wins_((0, 0, 0)):
+        return (0, 0, 0)
+
+    stack = list(ships)
+    for i in range(3):
+        low, high = 0, stack[i]
+        while low < high:
+            if deadline is not None and deadline.expired():
+                break
+            stack[i] = (low + high) // 2
+            if wins_(stack):
+                high = stack[i]
+            else:
+                low = stack[i] + 1
+        stack[i] = high
+
+    return tuple(stack)
+
+
+class MonotoneCache():
+    '''
+    answers of `test`, a test of ship stacks that holds for any more ships
+    than a stack it holds for, like a fight won.
+
+    keeps the least stacks it held for and the most it didn't, so a stack with
+    at least the ships of one of the former holds too and one with at most
+    the ships of one of the latter doesn't. those are answered by comparing,
+    only the others are tested.
+    '''
+
+    def __init__(self, test: Callable[[Ships], bool]):
+        self.test = test
+        self.won: List[Ships] = []
+        self.lost: List[Ships] = []
+
+    def wins(self, ships: Ships) -> bool:
+        a0, a1, a2 = ships
+        for w0, w1, w2 in self.won:
+            if a0 >= w0 and a1 >= w1 and a2 >= w2:
+                return True
+        for l0, l1, l2 in self.lost:
+            if a0 <= l0 and a1 <= l1 and a2 <= l2:
+                return False
 
-    fut_ships = p.ships_in(delay)
-    d = 1.0
-    for i in range(1, 6):
-        ships = ships_mul(p.ships, d)
-        ships_w_fut = ships_add(ships, fut_ships)
-        result = battle(attack_ships, ships_w_fut)
-        if result_defender_wins(*result):
-            defence_ships = ships
-            d -= 0.5**i
+        ships = (a0, a1, a2)
+        if not self.test(ships):
+            self.lost = [l for l in self.lost if not ships_le(l, ships)]
+            self.lost.append(ships)
+            return False
 
-    attack_ships = ships_sub(p.ships, defence_ships)
+        self.won = [w for w in self.won if not ships_le(ships, w)]
+        self.won.append(ships)
+        return True
 
-    return attack_ships
+
+class AttackThreshold(MonotoneCache):
+    '''
+    whether attackers beat `defender`, the stack of one target at one
+    arrival delay. only the attackers the known ones don't settle are fought
+    '''
+
+    def __init__(self, defender: Ships):
+        super().__init__(lambda attacker: not defender_wins(attacker, defender))
+        self.defender = defender
+
+    def fewest(self,
+               ships: Ships,
+               sent: Ships = (0, 0, 0),
+               deadline: Optional[Deadline] = None) -> Optional[Ships]:
+        '''
+        the fewest of `ships` that win together with the already `sent` ones
+        '''
+        return fewest(ships, lambda more: self.wins(ships_add(sent, more)),
+                      deadline)
+
+
+def attack_threshold(s: GameState, target: Planet, delay: int) -> AttackThreshold:
+    '''
+    the `AttackThreshold` of `target` for attackers landing in `delay`
+    rounds, shared by all the strats for the tick
+    '''
+    key = target.id, delay
+    if key not in s._thresholds:
+        # what the others' fleets leave when ours lands
+        timeline = s.timeline(target, without=s.player_id)
+        s._thresholds[key] = AttackThreshold(timeline.at(s.round + delay)[1])
+    return s._thresholds[key]
+
+
+def available_ships(sp: GameStatePer, s: GameState, p: Planet) -> Ships:
+    '''
+    the ships the attacked `p` can send and still hold against all the fleets
+    coming, None if it falls anyway. worked out once per planet and tick
+    '''
+    if p.id not in s._spare_ships:
+        garrison = None
+        if s.timeline(p).held(p.owner_id, s.round):
+            garrison = fewest(p.ships,
+                              lambda garrison: holds_out(s, p, garrison),
+                              sp.deadline)
+        s._spare_ships[p.id] = (None if garrison is None else ships_sub(
+            p.ships, garrison))
+
+    return s._spare_ships[p.id]
 
 
 def strat_capture_simple(sp: GameStatePer, s: GameState) -> Move:
     attacked, fleets = attacks(sp, s)
 
-    best_from, best_to, best_dist = None, None, 0
-    for target in unfriendly(s):
-        for src in friendly(s):
-            dist = sp.dist(src, target)
+    sources = [src for src in friendly(s) if not sp.is_reserved(src)]
 
-            if sp.is_reserved(src):
-                continue
+    candidates = []
+    for target in untargeted(s, friendly=True):
+        if sp.deadline.expired():
+            break
 
-            if best_from is not None and best_dist <= dist:
-                continue
+        for src in sources:
+            candidates.append((sp.dist(src, target), src, target))
 
-            if has_incoming_friendly_fleet(s, target):
-                continue
+    if len(candidates) == 0:
+        return Nop()
 
-            if src in attacked:
-                attack_ships = available_ships(sp, s, src)
-                # will loose
-                if attack_ships is None:
-                    continue
+    # will win, the nearest first
+    candidates.sort(key=lambda c: c[0])
+    best = None
+    for dist, src, target in candidates:
+        if sp.deadline.expired():
+            break
+
+        # attacked planets only send what they can spare, worked out as
+        # they come up as most are never needed
+        if src in attacked:
+            attack_ships = available_ships(sp, s, src)
+            # will loose
+            if attack_ships is None:
+                continue
 
-            else:
-                attack_ships = src.ships
+        else:
+            attack_ships = src.ships
 
-            # will win
-            result = simulate_fight(src, target, ships=attack_ships)
-            if result_defender_wins(*result):
-                continue
+        if not attack_threshold(s, target, dist).wins(attack_ships):
+            continue
 
-            best_from, best_to, best_dist, best_ships = src, target, dist, attack_ships
+        best = dist, src, target, attack_ships
+        break
 
-    if best_from is not None:
+    if best is not None:
+        best_dist, best_from, best_to, best_ships = best
+        if CAPTURE_FEWEST_SHIPS:
+            best_ships = attack_threshold(s, best_to, best_dist).fewest(
+                best_ships, deadline=sp.deadline)
         return Send(best_from, best_to, best_ships, PRIO_CAPTURE_SIMPLE,
                     'CaptureSimple')
 
@@ -411,6 +1057,17 @@ class StratCaptureMultiPlanetState():
     target_id: int
     send_round: int  # when send the second planet's fleet. 0 means inactive
 
+    def __post_init__(self):
+        # kept between rounds by `search`, not part of the dumped state.
+        # (src1, src2, delay1, delay2, delay_until_launch2) ids and delays of
+        # each target's candidates
+        self._pairs: Dict[int, List[Tuple[int, int, int, int, int]]] = dict()
+        # the targets whose sources were looked for past each planet
+        self._scanned: Dict[int, Set[int]] = dict()
+        # (friendly, attacked, reserved) of each planet when last searched
+        self._status: Dict[int, Tuple[bool, bool, bool]] = dict()
+        self._limits: Optional[tuple] = None
+
     def tick(self, sp: GameStatePer, s: GameState) -> Move:
         attacked, fleets = attacks(sp, s)
 
@@ -429,8 +1086,8 @@ class StratCaptureMultiPlanetState():
             delay = ongoing_fleet.eta - s.round
             src2_ships = src_2nd.ships_in(delay)
             ships = ships_add(src2_ships, ongoing_fleet.ships)
-            result = simulate_fight(src_2nd, target, ships, delay)
-            if result_defender_wins(*result):
+            threshold = attack_threshold(s, target, delay)
+            if not threshold.wins(ships):
                 print("Cancel multi attack cause defender will win")
                 self.cancel(sp)
                 return Nop()
@@ -439,11 +1096,20 @@ class StratCaptureMultiPlanetState():
                 # Do not nothing. Were waiting
                 return Nop()
 
+            ships = src_2nd.ships
+            if CAPTURE_FEWEST_SHIPS:
+                ships = threshold.fewest(ships, ongoing_fleet.ships,
+                                         sp.deadline) or ships
+                if sum(ships) == 0:
+                    print("Cancel multi attack cause the first fleet wins alone")
+                    self.cancel(sp)
+                    return Nop()
+
             # it's a timing dependent attack thus prio 4
             move = Send(
                 src_2nd,
                 target,
-                src_2nd.ships,
+                ships,
                 PRIO_CAPTURE_MULTI_2ND,
                 'CaptureMultiSend2',
                 on_discard=lambda sp, s: self.cancel(sp),
@@ -452,103 +1118,180 @@ class StratCaptureMultiPlanetState():
             return move
 
         if not self.active:
-            friendly_: List[Planet] = list(friendly(s))
-            unfriendly_: List[Planet] = list(unfriendly(s))
-
-            if len(friendly_) < 2:
+            move = self.search(sp, s)
+            if move is None:
                 return Nop()
 
-            moves = []  # were the possible attacks are kept
-            for target in unfriendly_:
-
-                if has_incoming_enemy_fleet(s, target):
-                    continue
+            target, src1, src2, delay1, delay2, delay_until_launch2, losses = move
 
-                for src1 in friendly_:
-                    src1: Planet
+            self.src_1st_id = src1.id
+            self.src_2nd_id = src2.id
+            self.target_id = target.id
+            self.send_round = s.round + delay_until_launch2
 
-                    if sp.is_reserved(src1):
-                        continue
+            return Send(
+                src1,
+                target,
+                src1.ships,
+                PRIO_CAPTURE_MULTI_START,
+                'CaptureMultiStart',
+                on_discard=self.on_discard,
+                on_send=self.on_send,
+            )
 
-                    if src1 in attacked:
-                        continue
+        assert False
 
-                    for src2 in friendly_:
-                        src2: Planet
+    def search(self, sp: GameStatePer, s: GameState) -> Optional[tuple]:
+        '''
+        finds the best (target, src1, src2, delay1, delay2, delay_until_launch2, losses)
+        attack, None if there is none.
+
+        for each target only the MULTI_CAPTURE_TOP_K nearest usable planets
+        within MULTI_CAPTURE_MAX_DIST are tried as sources. the attacker can't
+        loose more ships than it sends, so candidates are scored by most
+        ships first and the search stops once no candidate left can beat the
+        best one.
+
+        the sources of a target only change when a planet near it is taken,
+        attacked or reserved, so they are kept between rounds and only the
+        targets near such a planet look for them again.
+        '''
+        attacked, fleets = attacks(sp, s)
 
-                        if sp.is_reserved(src2):
-                            continue
+        friendly_: List[Planet] = list(friendly(s))
+        if len(friendly_) < 2:
+            return None
+
+        self.invalidate(sp, s, attacked)
+
+        # (-ships, order, pair), popped as the original sort by most ships
+        heap = []
+        for n, target in enumerate(untargeted(s)):
+            if sp.deadline.expired():
+                break
+
+            pairs = self._pairs.get(target.id)
+            if pairs is None:
+                pairs = self.find_pairs(sp, s, target, attacked)
+
+            for k, pair in enumerate(pairs):
+                src1, src2 = s.planet_get(pair[0]), s.planet_get(pair[1])
+                ships = (sum(src1.ships) + sum(src2.ships) +
+                         pair[4] * sum(src2.production))
+                heap.append((-ships, n, k, target, pair))
+
+        heapq.heapify(heap)
+
+        best = None
+        while heap:
+            # losses are at most the ships sent
+            if best is not None and best[6] >= -heap[0][0]:
+                break
+
+            if sp.deadline.expired():
+                break
+
+            candidates = []
+            for _ in range(min(MULTI_CAPTURE_BATCH, len(heap))):
+                *_, target, pair = heapq.heappop(heap)
+                src1, src2 = s.planet_get(pair[0]), s.planet_get(pair[1])
+                delay1, delay2, delay_until_launch2 = pair[2:]
+                src2_ships = src2.ships_in(delay_until_launch2)
+                ships = ships_add(src1.ships, src2_ships)
+                candidates.append((target, src1, src2, delay1, delay2,
+                                   delay_until_launch2, ships))
+
+            # if I will win, scoring a batch of candidates in one go
+            batch = []
+            for c in candidates:
+                if sp.deadline.expired():
+                    break
+                if attack_threshold(s, c[0], c[3]).wins(c[6]):
+                    batch.append(c)
 
-                        if src1.id == src2.id:
-                            continue
+            attackers = [c[6] for c in batch]
+            defenders = ships_in(s, [c[0] for c in batch],
+                                 [c[3] for c in batch])
+            results = battle_batch(attackers, defenders, sp.deadline)
+            if results is None:
+                break
 
-                        if src2 in attacked:
-                            continue
+            for c, *result in zip(batch, *results):
+                # a possible move, the best one looses the most
+                losses = sum(ships_sub(c[6], result[0]))
+                if best is None or losses > best[6]:
+                    best = c[:6] + (losses, )
 
-                        # src 1 is always farther to target
-                        delay1 = src1.distance(target)
-                        delay2 = src2.distance(target)
-                        if delay1 < delay2:
-                            continue
+        return best
 
-                        # can't perform this strat if both dists are equal
-                        if delay1 == delay2:
-                            continue
+    def invalidate(self, sp: GameStatePer, s: GameState, attacked: Set[Planet]):
+        '''
+        forgets the pairs of the targets near planets that were taken,
+        attacked or reserved since the last search
+        '''
+        limits = MULTI_CAPTURE_TOP_K, MULTI_CAPTURE_MAX_DIST
+        if limits != self._limits:
+            self._pairs.clear()
+            self._scanned.clear()
+            self._limits = limits
+
+        for p in s.planets:
+            status = (p.owner_id == s.player_id, p in attacked,
+                      sp.is_reserved(p))
+            if self._status.get(p.id) == status:
+                continue
 
-                        if has_incoming_friendly_fleet(s, target):
-                            continue
+            self._status[p.id] = status
+            for target_id in self._scanned.pop(p.id, ()):
+                self._pairs.pop(target_id, None)
+
+    def find_pairs(self, sp: GameStatePer, s: GameState, target: Planet,
+                   attacked: Set[Planet]) -> List[Tuple[int, int, int, int, int]]:
+        # usable sources, nearest to target first
+        srcs: List[Planet] = []
+        scanned: List[int] = []
+        for id in sp.neighbours(target):
+            if len(srcs) == MULTI_CAPTURE_TOP_K:
+                break
+
+            src = s.planet_get(id)
+            scanned.append(id)
+            if src.owner_id != s.player_id or src in attacked:
+                continue
 
-                        # if I will win
+            if (MULTI_CAPTURE_MAX_DIST is not None
+                    and sp.dist(src, target) > MULTI_CAPTURE_MAX_DIST):
+                break
 
-                        delay_until_launch2 = delay1 - delay2
-                        src2_ships = src2.ships_in(delay_until_launch2)
-                        ships = ships_add(src1.ships, src2_ships)
-                        result = simulate_fight(src2, target, ships, delay1)
-                        if result_defender_wins(*result):
-                            continue
+            if sp.is_reserved(src):
+                continue
 
-                        # a possible move
-                        losses = sum(ships_sub(ships, result[0]))
-                        move = (
-                            target,
-                            src1,
-                            src2,
-                            delay1,
-                            delay2,
-                            delay_until_launch2,
-                            losses,
-                        )
-                        moves.append(move)
+            srcs.append(src)
 
-            if len(moves) == 0:
-                return Nop()
+        pairs = []
+        for i, src2 in enumerate(srcs):
+            delay2 = sp.dist(src2, target)
 
-            # Find best move of the ones available (by loss)
+            # src 1 is always farther to target
+            for src1 in srcs[i + 1:]:
+                delay1 = sp.dist(src1, target)
 
-            moves.sort(key=lambda x: x[6])  # sort by losses
-            move = moves[-1]
-            target, src1, src2, delay1, delay2, delay_until_launch2, losses = move
+                # can't perform this strat if both dists are equal
+                if delay1 == delay2:
+                    continue
 
-            self.src_1st_id = src1.id
-            self.src_2nd_id = src2.id
-            self.target_id = target.id
-            self.send_round = s.round + delay_until_launch2
+                pairs.append((src1.id, src2.id, delay1, delay2, delay1 - delay2))
 
-            return Send(
-                src1,
-                target,
-                src1.ships,
-                PRIO_CAPTURE_MULTI_START,
-                'CaptureMultiStart',
-                on_discard=self.on_discard,
-                on_send=self.on_send,
-            )
+        # only a change to one of the planets looked at can change them
+        self._pairs[target.id] = pairs
+        for id in scanned:
+            self._scanned.setdefault(id, set()).add(target.id)
 
-        assert False
+        return pairs
 
     def ongoing_fleet(self, s: GameState) -> Optional[Fleet]:
-        for f in s.fleets:
-            if f.origin_id == self.src_1st_id and f.target_id == self.target_id:
+        for f in s.fleets_from(self.src_1st_id):
+            if f.target_id == self.target_id:
                 return f
 
         return None
@@ -561,7 +1304,7 @@ class StratCaptureMultiPlanetState():
 
     def cancel(self, sp: GameStatePer):
         if self.active:
-            stats.CaptureMultiCancel += 1
+            sp.stats.CaptureMultiCancel += 1
             sp.unreserve(self.src_2nd_id)
             self.send_round = 0
 
@@ -576,13 +1319,11 @@ def strat_bailout(sp: GameStatePer, s: GameState) -> Move:
     for fleet in attacking_fleets:
         # only bail if attack eminent
         delay = fleet.eta - s.round
-        if delay > 4:
+        if delay > BAILOUT_MAX_DELAY:
             continue
 
-        origin = s.planet_get(fleet.origin_id)
         target = s.planet_get(fleet.target_id)
-        result = simulate_fight(origin, target, fleet.ships, delay)
-        if result_defender_wins(*result):
+        if s.timeline(target).owner_at(fleet.eta) == s.player_id:
             continue
 
         production = target.ships_produced_in(delay)
@@ -590,9 +1331,7 @@ def strat_bailout(sp: GameStatePer, s: GameState) -> Move:
         if bailed:
             continue
 
-        safe_planets = list(
-            filter(lambda p: p not in attacked_planets, friendly(s)))
-        safe_planets.sort(key=lambda p: sp.dist(target, p))
+        safe_planets = nearest_friendly(sp, s, target, attacked_planets)
 
         if len(safe_planets) == 0:
             continue
@@ -614,30 +1353,21 @@ def strat_defend(sp: GameStatePer, s: GameState) -> Move:
     attacked_planets, attacking_fleets = attacks(sp, s)
 
     for fleet in attacking_fleets:
-        # only bail if attack eminent
-        delay = fleet.eta - s.round
+        if sp.deadline.expired():
+            break
 
-        origin = s.planet_get(fleet.origin_id)
         target = s.planet_get(fleet.target_id)
-        result = simulate_fight(origin, target, fleet.ships, delay)
-        if result_defender_wins(*result):
+        if s.timeline(target).owner_at(fleet.eta) == s.player_id:
             continue
 
-        planets_in_range: List[Planet] = []
-        for p in friendly(s):
-            if p not in attacked_planets:
-                planets_in_range.append(p)
-        planets_in_range.sort(key=lambda p: sp.dist(p, target))
-
-        # helping_fleets = incoming_friendly_fleet(s, target)
+        planets_in_range = nearest_friendly(sp, s, target, attacked_planets)
 
-        # helpers: List[Planet] = []
         for p in planets_in_range:
-            ships = target.ships_in(delay)
-            ships = ships_add(ships, p.ships)
-
-            result = simulate_fight(origin, target, fleet.ships, delay, ships)
-            if not result_defender_wins(*result):
+            # the help has to land by the time the attack does
+            helper = Fleet(-1, s.player_id, p.ships, p.id, target.id,
+                           s.round + sp.dist(p, target))
+            timeline = planet_timeline(s, target, extra=[helper])
+            if timeline.owner_at(fleet.eta) != s.player_id:
                 continue
 
             return Send(
@@ -651,11 +1381,18 @@ def strat_defend(sp: GameStatePer, s: GameState) -> Move:
     return Nop()
 
 
-def log(data):
+def profile_file(log_file: Optional[str]) -> str:
+    '''
+    where the `Instruments` summaries go, next to the `Stats` log
+    '''
+    return os.path.join(os.path.dirname(log_file or CSV_FILE), PROFILE_NAME)
+
+
+def log(data, path=CSV_FILE):
     cols_names = [f.name for f in fields(Stats)]
     try:
-        exists = not os.path.exists(CSV_FILE)
-        with open(CSV_FILE, 'a') as csvfile:
+        exists = not os.path.exists(path)
+        with open(path, 'a') as csvfile:
             writer = csv.DictWriter(csvfile, fieldnames=cols_names)
             if not exists:
                 writer.writeheader()
@@ -664,55 +1401,31 @@ def log(data):
         print("I/O error")
 
 
-def simulate_fight(src: Planet,
-                   target: Planet,
-                   ships=None,
-                   delay=None,
-                   ships_defence=None):
-    '''
-    coputes the battle result of attackign from `src` to `target` with ships after `delay` ticks
+def result_defender_wins(src, target) -> bool:
+    return sum(target) >= sum(src)
 
 
-    if ships is None, assumes all from the srcc are sent
-    if delay is None, assumes distance from `src` to `target`
+def damage_coeffs(def_type: int, att_type: int, numships: int = 3):
     '''
+    (multiplier, absolute) damage dealt by `att_type` ships to `def_type` ships
+    '''
+    if def_type == att_type:
+        multiplier = 0.1
+        absolute = 1
+    if (def_type - att_type) % numships == 1:
+        multiplier = 0.25
+        absolute = 2
+    if (def_type - att_type) % numships == numships - 1:
+        multiplier = 0.01
+        absolute = 1
+    return multiplier, absolute
 
-    if ships is None:
-        attacker = src.ships
-    else:
-        attacker = ships
-
-    if delay is None:
-        delay = src.distance(target)
-
-    ships_inc = [0, 0, 0]
-    for i in range(3):
-        ships_inc[i] = delay * target.production[i]
-
-    if ships_defence is None:
-        defender = [0, 0, 0]
-        for i in range(3):
-            defender[i] = target.ships[i] + ships_inc[i]
-    else:
-        defender = ships_defence
-
-    src_result, target_result = battle(attacker, defender)
-
-    return src_result, target_result
-
-
-def troops_needed(src_planet, target_planet, ships):
-    distance = src_planet.distance(target_planet)
-    ship_inc = [distance * p for p in target_planet.production]
-
-    attacker = src_planet.ships
-    defender = [n + ship_inc[i] + 1 for i, n in enumerate(target_planet.ships)]
-
-    return defender
 
-
-def result_defender_wins(src, target) -> bool:
-    return sum(target) >= sum(src)
+DAMAGE = [[damage_coeffs(d, a) for a in range(3)] for d in range(3)]
+# (multiplier, absolute) damage a type does to the same, the next and the
+# previous type, the same for all the types
+(SAME_M, SAME_A), (NEXT_M, NEXT_A), (PREV_M, PREV_A) = \
+    DAMAGE[0][0], DAMAGE[1][0], DAMAGE[2][0]
 
 
 def battle_round(attacker, defender):
@@ -721,47 +1434,426 @@ def battle_round(attacker, defender):
     defender = defender[::]
     for def_type in range(0, numships):
         for att_type in range(0, numships):
-            if def_type == att_type:
-                multiplier = 0.1
-                absolute = 1
-            if (def_type - att_type) % numships == 1:
-                multiplier = 0.25
-                absolute = 2
-            if (def_type - att_type) % numships == numships - 1:
-                multiplier = 0.01
-                absolute = 1
+            multiplier, absolute = DAMAGE[def_type][att_type]
             defender[def_type] -= max((attacker[att_type] * multiplier),
                                       (attacker[att_type] > 0) * absolute)
         defender[def_type] = max(0, defender[def_type])
     return defender
 
 
-def battle(s1, s2):
-    ships1 = s1[::]
-    ships2 = s2[::]
+def stack_damage(x, same_m=SAME_M, same_a=SAME_A, next_m=NEXT_M,
+                 next_a=NEXT_A, prev_m=PREV_M, prev_a=PREV_A):
+    # (same type, next type, previous type) damage of a stack of `x`, as
+    # `max` in `battle_round`. the coefficients are bound as defaults, they
+    # are read as fast as constants
+    if x > 0:
+        same, beats, weak = x * same_m, x * next_m, x * prev_m
+        return (same if same >= same_a else same_a,
+                beats if beats >= next_a else next_a,
+                weak if weak >= prev_a else prev_a)
+    return 0, 0, 0
+
+
+def battle_round3(ships1, ships2):
+    '''
+    both halves of a round, `battle_round(ships2, ships1)` and
+    `battle_round(ships1, ships2)`, unrolled for the 3 types. subtracts in
+    the same order so the floats are the same.
+    '''
+    a0, a1, a2 = ships1
+    b0, b1, b2 = ships2
+
+    a0s, a0n, a0p = stack_damage(a0)
+    a1s, a1n, a1p = stack_damage(a1)
+    a2s, a2n, a2p = stack_damage(a2)
+    b0s, b0n, b0p = stack_damage(b0)
+    b1s, b1n, b1p = stack_damage(b1)
+    b2s, b2n, b2p = stack_damage(b2)
+
+    a0 = a0 - b0s - b1p - b2n
+    a1 = a1 - b0n - b1s - b2p
+    a2 = a2 - b0p - b1n - b2s
+    b0 = b0 - a0s - a1p - a2n
+    b1 = b1 - a0n - a1s - a2p
+    b2 = b2 - a0p - a1n - a2s
+
+    return ((a0 if a0 > 0 else 0, a1 if a1 > 0 else 0, a2 if a2 > 0 else 0),
+            (b0 if b0 > 0 else 0, b1 if b1 > 0 else 0, b2 if b2 > 0 else 0))
+
+
+def battle_simulate(s1, s2):
+    ships1 = tuple(s1)
+    ships2 = tuple(s2)
     while sum(ships1) > 0 and sum(ships2) > 0:
-        new1 = battle_round(ships2, ships1)
-        ships2 = battle_round(ships1, ships2)
-        ships1 = new1
-        #print ships1,ships2
+        ships1, ships2 = battle_round3(ships1, ships2)
 
-    ships1 = map(int, ships1)
-    ships2 = map(int, ships2)
+    ships1 = tuple(map(int, ships1))
+    ships2 = tuple(map(int, ships2))
     #print ships1,ships2
     return ships1, ships2
 
 
+def outlasts(ships, enemy, keep) -> bool:
+    '''
+    True if some type of `ships` is sure to stay above `keep` until `enemy` is wiped out
+
+    while `ships` is alive every enemy stack looses at least one ship per
+    round, so the battle lasts at most `ceil(max(enemy))` more rounds. the
+    damage of the current round bounds every later one, as stacks only shrink.
+    '''
+    rounds = ceil(max(enemy))
+    e0s, e0n, e0p = stack_damage(enemy[0])
+    e1s, e1n, e1p = stack_damage(enemy[1])
+    e2s, e2n, e2p = stack_damage(enemy[2])
+
+    # the damage each type takes a round, as in `battle_round3`
+    for ships, damage in ((ships[0], e0s + e1p + e2n),
+                          (ships[1], e0n + e1s + e2p),
+                          (ships[2], e0p + e1n + e2s)):
+        left = ships - rounds * damage
+        # margin for the float error accumulated by the real simulation
+        if left > keep + 1e-9 * ships:
+            return True
+    return False
+
+
+def defender_wins_simulate(attacker, defender) -> bool:
+    ships1 = tuple(attacker)
+    ships2 = tuple(defender)
+    while sum(ships1) > 0 and sum(ships2) > 0:
+        # the larger side in every type stays larger in every round
+        if all(d >= a for a, d in zip(ships1, ships2)):
+            return True
+
+        max1, max2 = max(ships1), max(ships2)
+
+        # survivors are truncated, less than one of each is nothing
+        if max1 < 1:
+            return True
+
+        # an alive enemy deals at least max(1, 1% of its largest stack) per
+        # round and type, so `outlasts` can't hold unless a side dwarfs the
+        # other. checked first as it is much cheaper
+        # attacker keeps a whole ship until the defender is gone
+        if (max1 > ceil(max2) * max(1, 0.01 * max2)
+                and outlasts(ships1, ships2, 1)):
+            return False
+
+        # defender is never wiped out, so the attacker will be
+        if (max2 > ceil(max1) * max(1, 0.01 * max1)
+                and outlasts(ships2, ships1, 0)):
+            return True
+
+        ships1, ships2 = battle_round3(ships1, ships2)
+
+    return result_defender_wins(map(int, ships1), map(int, ships2))
+
+
+class BattleCache():
+    '''
+    LRU cache of `simulate(attacker, defender)` results keyed on the
+    (attacker, defender) ship tuples. The oldest entry is evicted once
+    `maxsize` is reached.
+    '''
+
+    def __init__(self, simulate: Callable, maxsize: int = BATTLE_CACHE_SIZE):
+        self.simulate = simulate
+        self.maxsize = maxsize
+        # precomputed results tried before simulating, see `use_battle_table`
+        self.table: Optional[Callable] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # misses found in the table
+        self.table_hits = 0
+        self._tbl: OrderedDict = OrderedDict()
+
+    def get(self, s1: Ships, s2: Ships) -> Any:
+        result = self.lookup(s1, s2)
+        if result is not None:
+            return result
+
+        if self.table is not None:
+            result = self.table(s1, s2)
+            if result is not None:
+                self.table_hits += 1
+        if result is None:
+            result = self.simulate(*self.key(s1, s2))
+        self.store(s1, s2, result)
+        return result
+
+    def lookup(self, s1: Ships, s2: Ships) -> Any:
+        '''
+        the cached result, None if it was never simulated
+        '''
+        key = self.key(s1, s2)
+
+        result = self._tbl.get(key)
+        if result is not None:
+            self.hits += 1
+            self._tbl.move_to_end(key)
+        return result
+
+    def store(self, s1: Ships, s2: Ships, result: Any):
+        '''
+        adds a result simulated elsewhere, counts as a miss
+        '''
+        self.misses += 1
+        self._tbl[self.key(s1, s2)] = result
+        if len(self._tbl) > self.maxsize:
+            self._tbl.popitem(last=False)
+            self.evictions += 1
+
+    @staticmethod
+    def key(s1: Ships, s2: Ships) -> Tuple[Ships, Ships]:
+        return tuple(map(int, s1)), tuple(map(int, s2))
+
+    def clear(self):
+        self._tbl.clear()
+        self.hits = self.misses = self.evictions = self.table_hits = 0
+
+    def __len__(self):
+        return len(self._tbl)
+
+    def __str__(self):
+        return (f'{self.simulate.__name__}: size={len(self)}/{self.maxsize}, '
+                f'hits={self.hits}, misses={self.misses}, '
+                f'evictions={self.evictions}, table_hits={self.table_hits}')
+
+
+battle_cache = BattleCache(battle_simulate)
+winner_cache = BattleCache(defender_wins_simulate)
+
+
+def use_battle_table(table):
+    '''
+    makes the battle caches look their misses up in `table` (a
+    `battletable.BattleTable`) before simulating, None to stop
+    '''
+    if table is None:
+        battle_cache.table = winner_cache.table = None
+    else:
+        battle_cache.table = table.lookup
+        winner_cache.table = table.defender_wins
+
+
+def battle(s1, s2):
+    return battle_cache.get(s1, s2)
+
+
+def defender_wins(attacker, defender) -> bool:
+    '''
+    `result_defender_wins(*battle(attacker, defender))`, but returns as soon
+    as the winner is decided instead of fighting to the last ship.
+    '''
+
+    result = battle_cache.lookup(attacker, defender)
+    if result is not None:
+        return result_defender_wins(*result)
+
+    return winner_cache.get(attacker, defender)
+
+
+def battle_round_batch(attacker, defender):
+    # vectorized `battle_round` over the rows of N x 3 float arrays
+    defender = defender.copy()
+    for def_type in range(0, 3):
+        for att_type in range(0, 3):
+            multiplier, absolute = DAMAGE[def_type][att_type]
+            att = attacker[:, att_type]
+            defender[:, def_type] -= np.maximum(att * multiplier,
+                                                (att > 0) * absolute)
+        defender[:, def_type] = np.maximum(0, defender[:, def_type])
+    return defender
+
+
+def battle_batch(attackers, defenders, deadline: Optional[Deadline] = None):
+    '''
+    `battle` for many (attacker, defender) pairs at once.
+
+    Takes two N x 3 sequences and returns the N x 3 survivors of each side.
+    Pairs already in the battle cache or its table are not fought again, the
+    others all advance in lock-step, finished ones masked out, and are cached. Falls
+    back to one `battle` per pair when numpy is not available. None if
+    `deadline` expires before all are fought.
+    '''
+
+    results = [battle_cache.lookup(a, d) for a, d in zip(attackers, defenders)]
+    missing = [i for i, r in enumerate(results) if r is None]
+
+    if battle_cache.table is not None:
+        for i in missing:
+            results[i] = battle_cache.table(attackers[i], defenders[i])
+            if results[i] is not None:
+                battle_cache.table_hits += 1
+                battle_cache.store(attackers[i], defenders[i], results[i])
+        missing = [i for i in missing if results[i] is None]
+
+    if np is None or len(missing) == 0:
+        for i in missing:
+            if deadline is not None and deadline.expired():
+                return None
+            results[i] = battle(attackers[i], defenders[i])
+
+    else:
+        survivors = battle_batch_simulate(
+            np.array([attackers[i] for i in missing], dtype=np.float64),
+            np.array([defenders[i] for i in missing], dtype=np.float64),
+            deadline)
+        if survivors is None:
+            return None
+
+        ships1, ships2 = survivors
+
+        survivors = zip(ships1.tolist(), ships2.tolist())
+        for i, (att, dfn) in zip(missing, survivors):
+            results[i] = tuple(att), tuple(dfn)
+            battle_cache.store(attackers[i], defenders[i], results[i])
+
+    return [r[0] for r in results], [r[1] for r in results]
+
+
+def battle_batch_simulate(ships1, ships2, deadline: Optional[Deadline] = None):
+    '''
+    `battle_simulate` of the rows of two N x 3 float arrays, all advancing in
+    lock-step, finished ones masked out. returns the int survivors, the
+    arrays are fought in place. None if `deadline` expires first.
+    '''
+
+    def alive(ships):
+        return ships[:, 0] + ships[:, 1] + ships[:, 2] > 0
+
+    fighting = np.flatnonzero(alive(ships1) & alive(ships2))
+    while len(fighting) > 0:
+        if deadline is not None and deadline.expired():
+            return None
+        att, dfn = ships1[fighting], ships2[fighting]
+        att, dfn = battle_round_batch(dfn, att), battle_round_batch(att, dfn)
+        ships1[fighting] = att
+        ships2[fighting] = dfn
+        fighting = fighting[alive(att) & alive(dfn)]
+
+    return ships1.astype(np.int64), ships2.astype(np.int64)
+
+
 class Agent():
-    def __init__(self):
+    def __init__(self,
+                 tick_budget: Optional[float] = None,
+                 log_file: Optional[str] = CSV_FILE):
+        '''
+        `tick_budget` is the time in seconds each tick may take, None for no limit
+        `log_file` is where the game's `Stats` are appended, None to not log
+        '''
         self.sp = GameStatePer()
         self.s: Optional[GameState] = None
+        # the next round as `speculate` projected it
+        self.projected: Optional[GameState] = None
+        self.tick_budget = tick_budget
+        self.log_file = log_file
+
+        # seconds spent and ticks run out of budget, per strat
+        self.strat_time: Dict[str, float] = dict()
+        self.strat_expired: Dict[str, int] = dict()
+        # seconds spent per strat in the last tick
+        self.tick_time: Dict[str, float] = dict()
+
+    def speculate(self, move: Move, stop: threading.Event):
+        '''
+        uses the wait for the other player to warm the caches, until `stop` is
+        set. meant to be run in a background thread, while nothing else
+        touches the agent.
+
+        first builds the timelines of the planets the strats look at on the
+        current state, `update` keeps the ones that still hold next round.
+        then runs the strats on a projection of the next round, the
+        timelines they build are taken over the same way by the next tick.
+        the persistent state isn't changed.
+        '''
+        s, sp = self.s, self.sp
+        if s is None or s.over:
+            return
+
+        # attacked planets for defence and garrisons, targets for captures
+        attacked, _ = attacks(sp, s)
+        planets = [(p, None) for p in attacked]
+        planets += [(p, s.player_id) for p in unfriendly(s)]
+        for p, without in planets:
+            if stop.is_set():
+                return
+            s.timeline(p, without)
+
+        scmps: StratCaptureMultiPlanetState = sp.strat_states[
+            StratCaptureMultiPlanetState.__name__]
+
+        # only the strats that don't touch the persistent state. the multi
+        # capture keeps its candidates from the states it searched, so it
+        # searches with a copy that starts empty
+        strats = [strat_defend, strat_capture_simple]
+        if not scmps.active:
+            strats.append(replace(scmps).search)
+
+        deadline = sp.deadline
+        sp.deadline = Deadline(stop=stop)
+        try:
+            projected = s.project(move)
+            self.projected = projected
+            for strat in strats:
+                if stop.is_set():
+                    break
+                strat(sp, projected)
+        finally:
+            sp.deadline = deadline
+
+    def print_budget(self):
+        for name, spent in self.strat_time.items():
+            expired = self.strat_expired.get(name, 0)
+            print(f'{name:35s} {spent:8.3f}s  out of budget {expired} times')
+
+    def strategies(self) -> List[Tuple[int, Callable]]:
+        '''
+        (prio, strat) in the order they are evaluated. `prio` is the best
+        priority the strat can return, so it is skipped when a move at least
+        as good was already found.
+        '''
+        scmps: StratCaptureMultiPlanetState = self.sp.strat_states[
+            StratCaptureMultiPlanetState.__name__]
+
+        # NOTE reevaluate bailout
+        # (PRIO_BAILOUT, strat_bailout),
+
+        if scmps.active:
+            # an ongoing multi attack is cheap to follow up and must see every
+            # tick, it cancels itself when its move is discarded
+            return [
+                (PRIO_CAPTURE_MULTI_2ND, scmps.tick),
+                (PRIO_DEFENCE, strat_defend),
+                (PRIO_CAPTURE_SIMPLE, strat_capture_simple),
+            ]
+
+        return [
+            (PRIO_DEFENCE, strat_defend),
+            (PRIO_CAPTURE_SIMPLE, strat_capture_simple),
+            (PRIO_CAPTURE_MULTI_START, scmps.tick),
+        ]
 
     def tick(self, raw: dict) -> Union[Send, Nop]:
-        s = GameState.load(raw)
-        self.s = s
+        if instruments is not None:
+            return instruments.tick(self, self._tick, raw)
+        return self._tick(raw)
+
+    def _tick(self, raw: dict) -> Union[Send, Nop]:
+        if self.s is None:
+            self.s = GameState.load(raw)
+        else:
+            self.s.update(raw)
+            if self.projected is not None:
+                self.s.adopt_timelines(self.projected)
+        self.projected = None
+        s = self.s
 
         self.sp.init(s)
         sp = self.sp
+        stats = sp.stats
 
         if s.over:
             if s.winner == s.player_id:
@@ -775,21 +1867,36 @@ class Agent():
                     stats.Opponent = p.name
                     break
 
-            log(asdict(stats))
+            if self.log_file is not None:
+                log(asdict(stats), self.log_file)
+            if instruments is not None:
+                instruments.dump(profile_file(self.log_file), self)
             return Nop()
 
         # STRATS
+        sp.deadline = Deadline(self.tick_budget)
+        self.tick_time = dict()
         moves = []
-        moves.append(strat_capture_simple(sp, s))
+        for prio, strat in self.strategies():
+            # skip the ones that can't beat a move we already have
+            if any(m.prio <= prio for m in moves):
+                continue
 
-        scmps: StratCaptureMultiPlanetState = self.sp.strat_states[
-            StratCaptureMultiPlanetState.__name__]
-        moves.append(scmps.tick(sp, s))
+            if sp.deadline.expired():
+                break
 
-        # NOTE reevaluate bailout
-        # moves.append(strat_bailout(sp, s))
+            name = strat.__qualname__
+            start = time.perf_counter()
+            moves.append(strat(sp, s))
+            spent = time.perf_counter() - start
+
+            self.tick_time[name] = spent
+            self.strat_time[name] = self.strat_time.get(name, 0) + spent
+            if sp.deadline.expired():
+                self.strat_expired[name] = self.strat_expired.get(name, 0) + 1
 
-        moves.append(strat_defend(sp, s))
+        if len(moves) == 0:
+            moves.append(Nop())
 
         # PICKING one
 
@@ -808,3 +1915,135 @@ class Agent():
             move.on_send(sp, s)
 
         return move
+
+
+@dataclass
+class Counters():
+    '''
+    what `Instruments` measured of one agent's game
+    '''
+    calls: Dict[str, int] = field(default_factory=dict)
+    time: Dict[str, float] = field(default_factory=dict)
+    ticks: List[float] = field(default_factory=list)
+    profiler: cProfile.Profile = field(default_factory=cProfile.Profile)
+
+
+class Instruments():
+    '''
+    hot path timers and call counters, and a cProfile of every
+    `profile_every`th tick (never if 0). only set up when PROFILE is in the
+    environment, eg. PROFILE=10, so they cost nothing otherwise.
+
+    the counters are kept per agent, the calls go to the agent ticking, and
+    are dumped and dropped at the end of its game. the ticks of the agents
+    must take turns, as they do in all the clients.
+    '''
+
+    # the module functions that are timed and counted
+    FUNCTIONS = [
+        'battle',
+        'battle_batch',
+        'defender_wins',
+        'attacks',
+        'available_ships',
+        'fewest',
+        'planet_timeline',
+        'holds_out',
+        'land',
+    ]
+
+    def __init__(self, profile_every: int = 0):
+        self.profile_every = profile_every
+        self.games: Dict[int, Counters] = dict()
+        self.ticking: Optional[Counters] = None
+
+    def instrument(self, module: dict):
+        for name in self.FUNCTIONS:
+            module[name] = self.timed(name, module[name])
+
+    def timed(self, name: str, f: Callable) -> Callable:
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            # not counted outside of a tick, like when speculating
+            counters = self.ticking
+            if counters is None:
+                return f(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                counters.calls[name] = counters.calls.get(name, 0) + 1
+                counters.time[name] = (counters.time.get(name, 0) +
+                                       time.perf_counter() - start)
+
+        return wrapper
+
+    def tick(self, agent: 'Agent', tick: Callable, raw: dict):
+        counters = self.games.setdefault(id(agent), Counters())
+        profile = (self.profile_every > 0
+                   and len(counters.ticks) % self.profile_every == 0)
+
+        self.ticking = counters
+        start = time.perf_counter()
+        if profile:
+            counters.profiler.enable()
+        try:
+            return tick(raw)
+        finally:
+            if profile:
+                counters.profiler.disable()
+            counters.ticks.append(time.perf_counter() - start)
+            self.ticking = None
+
+    def summary(self, agent: 'Agent', counters: Counters) -> str:
+        out = io.StringIO()
+        s = agent.s
+        print(f'=== player {s.player_id} vs {agent.sp.stats.Opponent}, '
+              f'round {s.round}, pid {os.getpid()}, '
+              f'{time.strftime("%Y-%m-%d %H:%M:%S")}', file=out)
+
+        ticks = sorted(counters.ticks)
+        if ticks:
+            p50 = ticks[len(ticks) // 2] * 1000
+            p99 = ticks[int(len(ticks) * 0.99)] * 1000
+            print(f'{len(ticks)} ticks, {sum(ticks):.3f}s, p50 {p50:.2f}ms, '
+                  f'p99 {p99:.2f}ms, max {ticks[-1] * 1000:.2f}ms', file=out)
+
+        print('\nstrats', file=out)
+        for name, spent in agent.strat_time.items():
+            expired = agent.strat_expired.get(name, 0)
+            print(f'    {name:35s} {spent:8.3f}s  out of budget {expired} times',
+                  file=out)
+
+        print('\ncalls', file=out)
+        for name in self.FUNCTIONS:
+            print(f'    {name:35s} {counters.calls.get(name, 0):8d} '
+                  f'{counters.time.get(name, 0):8.3f}s', file=out)
+
+        print(f'\n{battle_cache}\n{winner_cache}', file=out)
+
+        if self.profile_every > 0 and ticks:
+            print(f'\ncProfile of every {self.profile_every}th tick', file=out)
+            stats = pstats.Stats(counters.profiler, stream=out)
+            stats.sort_stats('cumulative').print_stats(30)
+
+        return out.getvalue() + '\n'
+
+    def dump(self, path: str, agent: 'Agent'):
+        '''
+        appends the summary of `agent`'s game to `path` and starts over
+        '''
+        counters = self.games.pop(id(agent), Counters())
+        try:
+            with open(path, 'a') as f:
+                f.write(self.summary(agent, counters))
+        except IOError:
+            print("I/O error")
+
+
+instruments: Optional[Instruments] = None
+if 'PROFILE' in os.environ:
+    instruments = Instruments(int(os.environ['PROFILE'] or 0))
+    instruments.instrument(globals())
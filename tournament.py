@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+'''
+Self-play tournament on the local engine, across all cores.
+
+Plays Agent `a` vs Agent `b` on reproducible maps (game i uses seed
+`--seed + i`, sides swapped every other game) and sums their `Stats`.
+Module constants of `shared` can be overridden per side to tune them, eg.
+
+    ./tournament.py --games 2000 -a PRIO_CAPTURE_SIMPLE=7 -b BAILOUT_MAX_DELAY=6
+'''
+
+import argparse
+import ast
+import contextlib
+import io
+import os
+import time
+from dataclasses import asdict, fields
+from multiprocessing import Pool
+from typing import Any, Dict, Optional
+
+import shared
+from engine import Game, play
+from shared import Agent, Stats
+
+
+@contextlib.contextmanager
+def overridden(module, values: Dict[str, Any]):
+    '''
+    sets the `values` module globals, restoring them afterwards
+    '''
+    old = {name: getattr(module, name) for name in values}
+    for name, value in values.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in old.items():
+            setattr(module, name, value)
+
+
+class TunedAgent(Agent):
+    '''
+    an Agent that plays with some of the `shared` constants overridden
+    '''
+
+    def __init__(self, overrides: Dict[str, Any]):
+        super().__init__(log_file=None)
+        self.overrides = overrides
+
+    def tick(self, raw: dict):
+        with overridden(shared, self.overrides):
+            return super().tick(raw)
+
+
+def play_game(job) -> dict:
+    '''
+    plays one game, run in a pool worker
+    '''
+    i, seed, n_planets, max_rounds, overrides = job
+
+    game = Game.generate(n_planets, seed, max_rounds=max_rounds)
+    sides = ['a', 'b'] if i % 2 == 0 else ['b', 'a']
+    agents = {
+        player.id: TunedAgent(overrides[side])
+        for player, side in zip(game.players, sides)
+    }
+
+    # the agents are chatty
+    with contextlib.redirect_stdout(io.StringIO()):
+        winner = play(game, agents)
+
+    result = {'game': i, 'seed': seed, 'rounds': game.round, 'winner': None}
+    for player, side in zip(game.players, sides):
+        result[side] = asdict(agents[player.id].sp.stats)
+        if winner == player.id:
+            result['winner'] = side
+
+    return result
+
+
+def parse_overrides(values) -> Dict[str, Any]:
+    overrides = dict()
+    for value in values:
+        name, _, value = value.partition('=')
+        if not hasattr(shared, name):
+            raise SystemExit(f'shared has no {name}')
+        overrides[name] = ast.literal_eval(value)
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--planets', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('-a', action='append', default=[], metavar='NAME=VALUE',
+                        help='override a shared constant for agent a')
+    parser.add_argument('-b', action='append', default=[], metavar='NAME=VALUE',
+                        help='override a shared constant for agent b')
+    args = parser.parse_args()
+
+    overrides = {'a': parse_overrides(args.a), 'b': parse_overrides(args.b)}
+    jobs = [(i, args.seed + i, args.planets, args.rounds, overrides)
+            for i in range(args.games)]
+
+    totals = {'a': Stats(), 'b': Stats()}
+    wins: Dict[Optional[str], int] = {'a': 0, 'b': 0, None: 0}
+
+    start = time.perf_counter()
+    with Pool(args.workers) as pool:
+        for result in pool.imap_unordered(play_game, jobs):
+            wins[result['winner']] += 1
+            for side, total in totals.items():
+                for f in fields(Stats):
+                    if f.type is int:
+                        value = getattr(total, f.name) + result[side][f.name]
+                        setattr(total, f.name, value)
+    spent = time.perf_counter() - start
+
+    print(f'{args.games} games in {spent:.1f}s, draws {wins[None]}')
+    for side, total in totals.items():
+        print(f'{side}: wins {wins[side]:5d}  {overrides[side]}')
+        for f in fields(Stats):
+            if f.type is int:
+                print(f'    {f.name:20s} {getattr(total, f.name):8d}')
+
+
+if __name__ == '__main__':
+    main()